@@ -0,0 +1,55 @@
+# bench_lcs.py
+"""
+Micro-benchmark: rouge_score's DP LCS table vs the bit-parallel kernel in evaluation/lcs.py.
+
+Usage:
+  python benchmarks/bench_lcs.py [--lengths 20 50 150 400] [--pairs 200]
+"""
+import os, sys, argparse, random, time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rouge_score import rouge_scorer
+from evaluation.lcs import LcsReference, Vocabulary
+
+
+def _random_pairs(length: int, n_pairs: int, vocab_size: int = 300, seed: int = 0):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(vocab_size)]
+    return [
+        ([rng.choice(words) for _ in range(length)], [rng.choice(words) for _ in range(length)])
+        for _ in range(n_pairs)
+    ]
+
+
+def _time(fn, pairs) -> float:
+    t0 = time.perf_counter()
+    for a, b in pairs:
+        fn(a, b)
+    return time.perf_counter() - t0
+
+
+def main(lengths, n_pairs):
+    print(f"{'tokens':>8} {'rouge_score (ms)':>18} {'bit-parallel (ms)':>18} {'speedup':>9}")
+    for length in lengths:
+        pairs = _random_pairs(length, n_pairs, seed=length)
+
+        def dp(a, b):
+            return rouge_scorer._lcs_table(a, b)[-1][-1]
+
+        # Encode and build reference masks outside the timed loop, as RougeEngine does
+        vocab = Vocabulary()
+        encoded = [(LcsReference(vocab.encode(a)), vocab.encode(b)) for a, b in pairs]
+        for (a, b), (ref, ids) in zip(pairs, encoded):
+            assert dp(a, b) == ref.lcs(ids)
+
+        t_dp = _time(dp, pairs)
+        t_bits = _time(lambda ref, ids: ref.lcs(ids), encoded)
+        print(f"{length:>8} {1000 * t_dp / n_pairs:>18.4f} {1000 * t_bits / n_pairs:>18.4f} {t_dp / t_bits:>8.1f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark LCS implementations used for ROUGE-L.")
+    ap.add_argument("--lengths", type=int, nargs="+", default=[20, 50, 150, 400], help="Tokens per sequence")
+    ap.add_argument("--pairs", type=int, default=200, help="Sequence pairs per length")
+    args = ap.parse_args()
+    main(args.lengths, args.pairs)
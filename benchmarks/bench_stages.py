@@ -0,0 +1,301 @@
+# bench_stages.py
+"""
+Per-stage throughput of the scoring pipeline.
+
+Every stage runs in its own subprocess over the same corpus, one question at a
+time, and reports answers/sec, p50/p95 latency per question and peak RSS.
+Setup (extractor resources, model load) happens on a warm-up question and is
+reported separately. Stages that need the NLI model are skipped when
+transformers is not installed.
+
+The *_corpus stages time compute_features and compute_features_batch over all
+answers of the corpus in one call, the batch engine's intended use; the run
+fails if the batch engine is slower than the scalar path on any corpus.
+
+Corpora: "synthetic" (fixed seed, no data files needed) and "truthfulqa"
+(data/clean/truthful_qa_train.csv).
+
+Usage:
+  python benchmarks/bench_stages.py [--corpus synthetic truthfulqa] [--stages bleu rouge ...]
+                                    [--questions 200] [--out results.json]
+                                    [--baseline old.json] [--tolerance 0.2]
+"""
+import os, sys, argparse, importlib.util, json, platform, random, subprocess, time
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+TRUTHFULQA_CSV = os.path.join(ROOT, "data", "clean", "truthful_qa_train.csv")
+NLI_STAGES = {"score_nli", "process_question"}
+# Stages timed once over every answer of the corpus instead of per question
+CORPUS_STAGES = {"compute_features_corpus": "compute_features", "compute_features_batch_corpus": "compute_features_batch"}
+STAGES = [
+    "compute_features", "compute_features_batch", "score_nli", "process_question",
+    "bleu", "rouge", "compute_ghi", "compute_metrics", "score_question",
+    "compute_features_corpus", "compute_features_batch_corpus",
+]
+
+_SUBJECTS = ["The Eiffel Tower", "Napoleon", "The Great Wall", "A goldfish", "Mount Everest",
+             "The moon landing", "Coffee", "New York", "The Roman Empire", "Lightning"]
+_VERBS = ["was built in", "is located in", "happened in", "costs about", "is visible from",
+          "was founded in", "lasts", "weighs", "is taller than", "was discovered in"]
+_OBJECTS = ["Paris", "China", "1969", "$5", "space", "1889", "three seconds", "London",
+            "200 kilograms", "Canada", "the 5th century", "Japan", "12 meters", "Brazil"]
+_TAILS = ["", " according to most historians", " but nobody knows for sure", " in 2004",
+          ", which surprises many people", " and it still does today"]
+
+
+def _sentence(rng: random.Random) -> str:
+    return f"{rng.choice(_SUBJECTS)} {rng.choice(_VERBS)} {rng.choice(_OBJECTS)}{rng.choice(_TAILS)}."
+
+
+def synthetic_corpus(n_questions: int = 200, seed: int = 0) -> List[Dict[str, Any]]:
+    """Questions in process_question's shape with 2-6 true and 2-6 false answers each."""
+    rng = random.Random(seed)
+    out = []
+    for qid in range(n_questions):
+        true_answers = list(dict.fromkeys(_sentence(rng) for _ in range(rng.randint(2, 6))))
+        false_answers = [a for a in dict.fromkeys(_sentence(rng) for _ in range(rng.randint(2, 6)))
+                         if a not in true_answers]
+        out.append({
+            "qid": qid,
+            "question": f"Where or when {rng.choice(_VERBS)} {rng.choice(_SUBJECTS).lower()}?",
+            "true_answers": true_answers,
+            "false_answers": false_answers,
+            "best_true_text": true_answers[0],
+            "best_false_text": false_answers[0] if false_answers else None,
+        })
+    return out
+
+
+def truthfulqa_corpus(n_questions: Optional[int] = None) -> List[Dict[str, Any]]:
+    import pandas as pd
+    from data_pipeline.stages import iter_questions
+
+    df = pd.read_csv(TRUTHFULQA_CSV)
+    if n_questions:
+        df = df.head(n_questions)
+    return list(iter_questions(df))
+
+
+def load_corpus(name: str, n_questions: Optional[int]) -> List[Dict[str, Any]]:
+    if name == "synthetic":
+        return synthetic_corpus(n_questions or 200)
+    if name == "truthfulqa":
+        return truthfulqa_corpus(n_questions)
+    raise ValueError(f"Unknown corpus {name!r}")
+
+
+def _answer_rows(q: Dict[str, Any], seed: int = 0) -> List[Dict[str, Any]]:
+    """Feature-file rows for a question with NLI/entity columns filled by a seeded RNG."""
+    from evaluation.metric_calculation import METRIC_INPUTS
+
+    rng = random.Random(f"{seed}-{q['qid']}")
+    rows = []
+    for ans in q["true_answers"] + q["false_answers"]:
+        is_true = ans in q["true_answers"]
+        best = q["best_true_text"] if is_true else q["best_false_text"]
+        row = {
+            "qid": q["qid"], "question": q["question"], "answer": ans,
+            "true_answer": is_true, "false_answer": not is_true,
+            "best_true_answer": is_true and ans == best,
+            "best_false_answer": (not is_true) and ans == best,
+        }
+        for key in METRIC_INPUTS:
+            if key.startswith("entity_"):
+                row[key] = float(rng.randint(0, 4))
+            elif key == "reading_ease":
+                row[key] = rng.uniform(-20.0, 110.0)
+            else:
+                row[key] = rng.uniform(0.0, 1.0)
+        rows.append(row)
+    return rows
+
+
+def _stage_fn(stage: str) -> Callable[[Dict[str, Any]], Any]:
+    """Callable that runs `stage` over every answer of one question."""
+    if stage == "compute_features":
+        from features.aggregate_features import compute_features
+        return lambda q: [compute_features(a) for a in q["true_answers"] + q["false_answers"]]
+    if stage == "compute_features_batch":
+        from features.batch import compute_features_batch
+        return lambda q: compute_features_batch(q["true_answers"] + q["false_answers"])
+    if stage == "score_nli":
+        from features.nli_scoring import configure_nli_cache, score_nli
+        configure_nli_cache(None)
+        return lambda q: [score_nli(q["question"], a) for a in q["true_answers"] + q["false_answers"]]
+    if stage == "process_question":
+        from features.aggregate_features import process_question
+        from features.nli_scoring import configure_nli_cache
+        configure_nli_cache(None)
+        return lambda q: process_question(**{k: v for k, v in q.items() if k != "rows"})
+    if stage in ("bleu", "rouge"):
+        from evaluation.question_index import QuestionIndex
+        from evaluation.bleu import BleuEngine
+        from evaluation.rouge import RougeEngine
+        engine_cls = BleuEngine if stage == "bleu" else RougeEngine
+
+        def run(q):
+            index = QuestionIndex.from_rows(q["rows"], qid=q["qid"])
+            engine = engine_cls(index=index)
+            return [engine.score_id(i, leave_one_out=True) for i in index.answer_ids]
+        return run
+    if stage == "compute_ghi":
+        from evaluation.metric_calculation import compute_ghi, compute_tuned_ghi
+        return lambda q: [(compute_ghi(r), compute_tuned_ghi(r)) for r in q["rows"]]
+    if stage == "compute_metrics":
+        from evaluation.metric_calculation import METRIC_INPUTS, compute_metrics
+        return lambda q: compute_metrics({k: [r.get(k) for r in q["rows"]] for k in METRIC_INPUTS})
+    if stage == "score_question":
+        from data_pipeline.stages import score_question
+        return lambda q: score_question([dict(r) for r in q["rows"]])
+    raise ValueError(f"Unknown stage {stage!r}")
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_stage(stage: str, corpus: str, n_questions: Optional[int]) -> Dict[str, Any]:
+    """Time one stage in this process; meant to run in a fresh subprocess per stage."""
+    import numpy as np
+
+    questions = load_corpus(corpus, n_questions)
+    for q in questions:
+        q["rows"] = _answer_rows(q)
+    rss_before = _peak_rss_mb()
+
+    t0 = time.perf_counter()
+    fn = _stage_fn(CORPUS_STAGES.get(stage, stage))
+    fn(questions[0])  # warm-up: lazy resources, model load
+    setup_s = time.perf_counter() - t0
+
+    if stage in CORPUS_STAGES:
+        questions = [{
+            "true_answers": [a for q in questions for a in q["true_answers"]],
+            "false_answers": [a for q in questions for a in q["false_answers"]],
+        }]
+
+    latencies = []
+    n_answers = 0
+    for q in questions:
+        t = time.perf_counter()
+        fn(q)
+        latencies.append(time.perf_counter() - t)
+        n_answers += len(q["true_answers"]) + len(q["false_answers"])
+
+    total = sum(latencies)
+    ms = np.array(latencies) * 1000.0
+    return {
+        "questions": len(questions),
+        "answers": n_answers,
+        "total_s": round(total, 4),
+        "setup_s": round(setup_s, 4),
+        "answers_per_sec": round(n_answers / total, 2) if total > 0 else None,
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "peak_rss_mb": _peak_rss_mb(),
+        "corpus_rss_mb": rss_before,
+    }
+
+
+def _skip_reason(stage: str) -> Optional[str]:
+    if stage in NLI_STAGES and importlib.util.find_spec("transformers") is None:
+        return "transformers not installed"
+    return None
+
+
+def _run_in_subprocess(stage: str, corpus: str, n_questions: Optional[int]) -> Dict[str, Any]:
+    cmd = [sys.executable, os.path.abspath(__file__), "--run-stage", stage, "--corpus", corpus]
+    if n_questions:
+        cmd += ["--questions", str(n_questions)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Stages whose answers/sec fell by more than `tolerance` (a fraction) against the baseline."""
+    regressions = []
+    for corpus, stages in results["corpora"].items():
+        for stage, res in stages.items():
+            old = baseline.get("corpora", {}).get(corpus, {}).get(stage, {}).get("answers_per_sec")
+            new = res.get("answers_per_sec")
+            if old and new and new < old * (1.0 - tolerance):
+                regressions.append(f"{corpus}/{stage}: {old:.1f} -> {new:.1f} answers/sec")
+    return regressions
+
+
+def batch_slower(results: Dict[str, Any]) -> List[str]:
+    """Corpora where compute_features_batch is slower than compute_features over the whole corpus."""
+    slower = []
+    for corpus, stages in results["corpora"].items():
+        scalar = stages.get("compute_features_corpus", {}).get("answers_per_sec")
+        batch = stages.get("compute_features_batch_corpus", {}).get("answers_per_sec")
+        if scalar and batch and batch < scalar:
+            slower.append(f"{corpus}: compute_features_batch {batch:.1f} < compute_features {scalar:.1f} answers/sec")
+    return slower
+
+
+def main(corpora: List[str], stages: List[str], n_questions: Optional[int], out_path: Optional[str],
+         baseline_path: Optional[str] = None, tolerance: float = 0.2) -> int:
+    results: Dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "questions": n_questions,
+        "corpora": {},
+    }
+    print(f"{'corpus':<11} {'stage':<30} {'answers/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'setup s':>8} {'peak MB':>8}")
+    for corpus in corpora:
+        results["corpora"][corpus] = {}
+        for stage in stages:
+            reason = _skip_reason(stage)
+            res = {"skipped": reason} if reason else _run_in_subprocess(stage, corpus, n_questions)
+            results["corpora"][corpus][stage] = res
+            if "answers_per_sec" in res:
+                rss = res["peak_rss_mb"]
+                print(f"{corpus:<11} {stage:<30} {res['answers_per_sec']:>10.1f} {res['p50_ms']:>9.3f} "
+                      f"{res['p95_ms']:>9.3f} {res['setup_s']:>8.2f} {rss if rss is None else round(rss):>8}")
+            else:
+                print(f"{corpus:<11} {stage:<30} {res.get('skipped') or res.get('error')}")
+
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {out_path}")
+
+    regressions = batch_slower(results)
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            regressions += compare(results, json.load(f), tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark each stage of the scoring pipeline.")
+    ap.add_argument("--corpus", nargs="+", default=["synthetic", "truthfulqa"], choices=["synthetic", "truthfulqa"])
+    ap.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    ap.add_argument("--questions", type=int, default=None,
+                    help="Questions per corpus (synthetic defaults to 200, truthfulqa to the whole file)")
+    ap.add_argument("--out", type=str, default=None, help="Write results as JSON")
+    ap.add_argument("--baseline", type=str, default=None,
+                    help="Earlier --out JSON; exit 1 if a stage's answers/sec dropped by more than --tolerance")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="Allowed answers/sec drop vs --baseline")
+    ap.add_argument("--run-stage", type=str, default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run_stage:
+        print(json.dumps(run_stage(args.run_stage, args.corpus[0], args.questions)))
+        sys.exit(0)
+    sys.exit(main(args.corpus, args.stages, args.questions, args.out, args.baseline, args.tolerance))
@@ -0,0 +1,176 @@
+# data_pipeline/stages.py
+"""
+Per-question stages shared by features_script.py, metrics_script.py and
+pipeline.py.
+
+iter_questions turns a TruthfulQA-style DataFrame into process_question
+arguments; process_questions_parallel runs text features in a process pool
+with NLI in the calling process. score_question adds the metrics to one
+question's feature rows, and score_questions_parallel does that in a pool.
+"""
+import ast
+import os
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Deque, Dict, Iterator, List
+
+import pandas as pd
+
+from features.aggregate_features import compute_features, process_question
+from evaluation.metric_calculation import compute_ra, compute_cc, compute_lhc, compute_ghi, compute_tuned_ghi
+from evaluation.bleu import BleuEngine
+from evaluation.rouge import RougeEngine
+from evaluation.question_index import QuestionIndex
+
+DEFAULT_NLI_CACHE = os.path.join("data", "cache", "nli_cache.sqlite")
+QUESTIONS_PER_TASK = 16  # question groups sent to a scoring worker at once
+
+
+def iter_questions(df: pd.DataFrame) -> Iterator[Dict[str, Any]]:
+    """Yield process_question kwargs for every non-empty question row."""
+    for idx, row in df.iterrows():
+        qid = row.get("Question ID", row.get("qid", idx))
+        q = row.get("Question", "")
+        true_list = list(ast.literal_eval(row.get("Correct Answers", "[]").strip() or "[]"))
+        false_list = list(ast.literal_eval(row.get("Incorrect Answers", "[]").strip() or "[]"))
+        raw_best_true = str(row.get("Best Answer", "") or "")
+        raw_best_false = str(row.get("Best Incorrect Answer", "") or "")
+        
+        # Normalize for membership checks
+        true_lower = {t.strip().lower() for t in true_list}
+        false_lower = {f.strip().lower() for f in false_list}
+        
+        best_true_text = None
+        if raw_best_true.strip() and raw_best_true.strip().lower() in true_lower:
+            best_true_text = raw_best_true.strip()
+
+        best_false_text = None
+        if raw_best_false.strip() and raw_best_false.strip().lower() in false_lower:
+            best_false_text = raw_best_false.strip()
+        
+        all_answers = true_list + false_list
+        if not all_answers:
+            print(f"Skipping empty question {qid}: {q}")
+            continue
+
+        yield {
+            "qid": qid,
+            "question": q,
+            "true_answers": true_list,
+            "false_answers": false_list,
+            "best_true_text": best_true_text,
+            "best_false_text": best_false_text,
+        }
+
+
+def _init_worker():
+    # Load extractor resources (lexicons, gazetteers, WordNet) once per worker
+    compute_features("Warm up the extractors in New York.")
+
+
+def _answer_features(answers: List[str]) -> Dict[str, Dict[str, float]]:
+    return {ans: compute_features(ans) for ans in dict.fromkeys(answers)}
+
+
+def process_questions_parallel(questions: Iterator[Dict[str, Any]], workers: int, nli_batch_size: int) -> Iterator[List[dict]]:
+    """
+    Text features run in a process pool while NLI stays in this process, so the
+    model is loaded once. Questions are yielded in input order.
+    """
+    window = workers * 4
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                             initializer=_init_worker) as pool:
+        pending: Deque = deque()
+        for q in questions:
+            pending.append((q, pool.submit(_answer_features, q["true_answers"] + q["false_answers"])))
+            if len(pending) < window:
+                continue
+            q_done, fut = pending.popleft()
+            yield process_question(**q_done, batch_size=nli_batch_size, text_features=fut.result())
+
+        while pending:
+            q_done, fut = pending.popleft()
+            yield process_question(**q_done, batch_size=nli_batch_size, text_features=fut.result())
+
+
+def score_question(rows: List[Dict]) -> List[Dict]:
+    """Add core metrics, BLEU and ROUGE to every row of one question group (one qid)."""
+    # One pass over the group: references, anchors and each row's answer id
+    index = QuestionIndex.from_rows(rows, qid=str(rows[0].get("qid")) if rows else None)
+    bleu = BleuEngine(index=index)
+    rouge = RougeEngine(index=index)
+    bta = index.bta  # may be None
+    bfa = index.bfa  # may be None
+
+    for i, r in enumerate(rows):
+        answer_id = index.answer_ids[i]
+
+        # Core metrics (per-row). A group is ~10 rows, too few for compute_metrics'
+        # column setup to pay off; it is for whole files (see evaluation/sweep.py)
+        r["RA"] = compute_ra(r)
+        r["CC"] = compute_cc(r)
+        r["LHC"] = compute_lhc(r)
+        r["GHI"] = compute_ghi(r)
+        r["alt_GHI"] = compute_tuned_ghi(r)
+
+        # BLEU: corpus-level (contrastive) vs. all refs and anchor-level vs. BTA/BFA
+        bleu_scores = bleu.score_id(answer_id, leave_one_out=True)
+
+        # Add all 6 metrics to the row
+        r.update({
+            # anchors
+            "bta": bta if bta else "",
+            "bfa": bfa if bfa else "",
+            # corpus-level
+            "bleu_pos": bleu_scores["bleu_pos"],
+            "bleu_neg_max": bleu_scores["bleu_neg_max"],
+            "bleu_contrast": bleu_scores["bleu_contrast"],
+            # anchor-level
+            "bleu_bta": bleu_scores["bleu_bta"],
+            "bleu_bfa": bleu_scores["bleu_bfa"],
+            "bleu_bta_minus_bfa": bleu_scores["bleu_bta_minus_bfa"],
+        })
+        
+        # ROUGE: corpus-level (contrastive) and anchor-level in one pass
+        rouge_scores = rouge.score_id(answer_id, leave_one_out=True)
+
+        r.update({
+            # corpus-level
+            "rouge_pos": rouge_scores["rouge_pos"],
+            "rouge_neg_max": rouge_scores["rouge_neg_max"],
+            "rouge_contrast": rouge_scores["rouge_contrast"],
+            # anchor-level
+            "rouge_bta": rouge_scores["rouge_bta"],
+            "rouge_bfa": rouge_scores["rouge_bfa"],
+            "rouge_bta_minus_bfa": rouge_scores["rouge_bta_minus_bfa"],
+        })
+
+    return rows
+
+def _score_questions(groups: List[List[Dict]]) -> List[List[Dict]]:
+    return [score_question(g) for g in groups]
+
+def _iter_batches(groups: Iterator[List[Dict]], size: int) -> Iterator[List[List[Dict]]]:
+    batch: List[List[Dict]] = []
+    for g in groups:
+        batch.append(g)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def score_questions_parallel(groups: Iterator[List[Dict]], workers: int) -> Iterator[List[Dict]]:
+    """Score batches of question groups in a process pool; groups are yielded in input order."""
+    window = workers * 4
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        pending: Deque = deque()
+        for batch in _iter_batches(groups, QUESTIONS_PER_TASK):
+            pending.append(pool.submit(_score_questions, batch))
+            if len(pending) < window:
+                continue
+            yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
@@ -0,0 +1,235 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation.metric_calculation import METRIC_INPUTS
+from data_pipeline import writers
+from data_pipeline.writers import BufferedRowWriter, ParquetRowWriter, iter_parquet_rows
+from scripts import features_script, metrics_script, pipeline
+import features.nli_scoring as nli_scoring
+
+import ast
+import hashlib
+import json
+import random
+import tempfile
+import pandas as pd
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "clean", "truthful_qa_train.csv")
+
+def _feature_rows(n_questions=12, seed=0):
+    """Feature-file rows for the first questions of the dataset, metric inputs drawn from a seeded RNG."""
+    rng = random.Random(seed)
+    rows = []
+    for qid, row in pd.read_csv(DATA_PATH).head(n_questions).iterrows():
+        true_list = ast.literal_eval(row["Correct Answers"])
+        false_list = ast.literal_eval(row["Incorrect Answers"])
+        for ans in true_list + false_list:
+            is_true = ans in true_list
+            r = {
+                "qid": qid, "question": row["Question"], "answer": ans,
+                "true_answer": is_true,
+                "best_true_answer": is_true and ans == row["Best Answer"],
+                "best_false_answer": (not is_true) and ans == row["Best Incorrect Answer"],
+            }
+            for key in METRIC_INPUTS:
+                r[key] = rng.choice([None, rng.uniform(0.0, 1.0), float(rng.randint(0, 3))])
+            rows.append(r)
+    return rows
+
+def _fake_nli_batch(nli, batch):
+    """Deterministic stand-in for the NLI model: scores derived from a hash of the pair."""
+    out = []
+    for premise, hypothesis in batch:
+        digest = hashlib.md5(f"{premise}|{hypothesis}".encode()).digest()
+        e, c = digest[0] + 1, digest[1] + 1
+        total = e + c + 10
+        out.append({"ENTAILMENT": e / total, "NEUTRAL": 10 / total, "CONTRADICTION": c / total})
+    return out
+
+def _write_jsonl(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r) + "\n")
+
+# Parquet Tests #
+
+def test_parquet_writer_round_trip_with_schema_drift():
+    rows = [{"qid": i, "answer": f"a{i % 3}", "score": i} for i in range(5)]
+    rows += [{"qid": 5, "answer": "a2", "score": 0.5, "extra": "x"}]  # float in an int column, new column
+    rows += [{"qid": 6, "score": None}]                               # missing columns
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rows.parquet")
+        writer = ParquetRowWriter(path, row_group_size=2)
+        for i in range(0, len(rows), 2):
+            writer.write_rows(rows[i:i + 2])
+        writer.close()
+
+        assert writer.rows_written == len(rows)
+        assert os.listdir(tmp) == ["rows.parquet"]  # parts merged and removed
+        back = list(iter_parquet_rows(path))
+        assert [r["score"] for r in back] == [0, 1, 2, 3, 4, 0.5, None]
+        assert [r["answer"] for r in back] == ["a0", "a1", "a2", "a0", "a1", "a2", None]
+        assert [r["extra"] for r in back] == [None] * 5 + ["x", None]
+
+        projected = list(iter_parquet_rows(path, columns=["extra", "qid", "missing"], limit=3))
+        assert projected == [{"qid": 0, "extra": None}, {"qid": 1, "extra": None}, {"qid": 2, "extra": None}]
+
+def test_metrics_script_parquet_matches_jsonl():
+    rows = _feature_rows()
+    with tempfile.TemporaryDirectory() as tmp:
+        jsonl_in, parquet_in = os.path.join(tmp, "feat.jsonl"), os.path.join(tmp, "feat.parquet")
+        _write_jsonl(jsonl_in, rows)
+        writer = ParquetRowWriter(parquet_in, row_group_size=50)
+        writer.write_rows(rows)
+        writer.close()
+
+        metrics_script.main(jsonl_in, os.path.join(tmp, "from_jsonl.csv"))
+        metrics_script.main(parquet_in, os.path.join(tmp, "from_parquet.csv"))
+        with open(os.path.join(tmp, "from_jsonl.csv"), "rb") as a, open(os.path.join(tmp, "from_parquet.csv"), "rb") as b:
+            assert a.read() == b.read()
+
+# BufferedRowWriter Tests #
+
+def test_buffered_writer_flushes_every_n_rows_and_fsyncs_before_on_durable():
+    events = []
+    fsync = writers.os.fsync
+    writers.os.fsync = lambda fd: (events.append("fsync"), fsync(fd))
+    try:
+        for fmt in ("csv", "jsonl"):
+            events.clear()
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, f"rows.{fmt}")
+                writer = BufferedRowWriter(path, fmt, columns=["i"], flush_rows=3, flush_seconds=3600,
+                                           on_durable=lambda rows: events.append([r["i"] for r in rows]))
+                for i in range(7):
+                    writer.write_row({"i": i})
+                assert events == ["fsync", [0, 1, 2], "fsync", [3, 4, 5]]
+                assert writer.rows_written == 6
+                writer.close()
+                assert events[-2:] == ["fsync", [6]]
+                with open(path, encoding="utf-8") as f:
+                    assert len(f.read().splitlines()) == 7 + (fmt == "csv")
+    finally:
+        writers.os.fsync = fsync
+
+def test_buffered_writer_parquet_durable_at_close_and_no_append():
+    durable = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rows.parquet")
+        writer = BufferedRowWriter(path, "parquet", flush_rows=2, on_durable=lambda rows: durable.extend(rows))
+        writer.write_rows({"i": i} for i in range(5))
+        assert writer.rows_written == 4 and durable == []
+        writer.close()
+        assert [r["i"] for r in durable] == list(range(5))
+        assert [r["i"] for r in iter_parquet_rows(path)] == list(range(5))
+
+        try:
+            BufferedRowWriter(path, "parquet")
+            assert False, "existing Parquet file opened for appending"
+        except ValueError:
+            pass
+        writer = BufferedRowWriter(path, "parquet", mode="w")
+        writer.write_row({"i": 9})
+        writer.close()
+        assert [r["i"] for r in iter_parquet_rows(path)] == [9]
+
+# metrics_script Tests #
+
+def test_metrics_script_accepts_interleaved_qids():
+    rows = _feature_rows()
+    # Interleave questions while keeping each qid's own row order
+    rng = random.Random(1)
+    queues = {}
+    for i, r in enumerate(rows):
+        queues.setdefault(r["qid"], []).append(i)
+    order = []
+    while queues:
+        qid = rng.choice(list(queues))
+        order.append(queues[qid].pop(0))
+        if not queues[qid]:
+            del queues[qid]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        grouped_in, mixed_in = os.path.join(tmp, "grouped.jsonl"), os.path.join(tmp, "mixed.jsonl")
+        _write_jsonl(grouped_in, rows)
+        _write_jsonl(mixed_in, [rows[i] for i in order])
+        metrics_script.main(grouped_in, os.path.join(tmp, "grouped.csv"), assume_grouped=True)
+        metrics_script.main(mixed_in, os.path.join(tmp, "mixed.csv"))
+        grouped = pd.read_csv(os.path.join(tmp, "grouped.csv"))
+        mixed = pd.read_csv(os.path.join(tmp, "mixed.csv"))
+
+        try:
+            metrics_script.main(mixed_in, os.path.join(tmp, "fail.csv"), assume_grouped=True)
+            assert False, "interleaved input accepted with assume_grouped"
+        except ValueError:
+            pass
+
+    pd.testing.assert_frame_equal(mixed, grouped.iloc[order].reset_index(drop=True))
+
+# features_script Tests #
+
+def test_features_script_resume_after_crash_matches_full_run():
+    get_nli, run_batch = nli_scoring._get_nli, nli_scoring._run_batch
+    nli_scoring._get_nli, nli_scoring._run_batch = (lambda: None), _fake_nli_batch
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            full, crashed = os.path.join(tmp, "full.jsonl"), os.path.join(tmp, "crashed.jsonl")
+            features_script.main(DATA_PATH, full, preview_n=5, nli_cache_path=None)
+            features_script.main(DATA_PATH, crashed, preview_n=5, nli_cache_path=None)
+
+            # Crash while writing the third question: part of its rows and half its checkpoint line on disk
+            with open(crashed + ".ckpt", "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            second, third = json.loads(lines[1])["offset"], json.loads(lines[2])["offset"]
+            with open(crashed, "r+b") as f:
+                f.truncate((second + third) // 2)
+            with open(crashed + ".ckpt", "w", encoding="utf-8") as f:
+                f.writelines(lines[:2])
+                f.write(lines[2][:len(lines[2]) // 2])
+
+            features_script.main(DATA_PATH, crashed, preview_n=5, nli_cache_path=None, resume=True)
+            with open(full, "rb") as a, open(crashed, "rb") as b:
+                assert a.read() == b.read()
+            with open(full + ".ckpt", "rb") as a, open(crashed + ".ckpt", "rb") as b:
+                assert a.read() == b.read()
+    finally:
+        nli_scoring._get_nli, nli_scoring._run_batch = get_nli, run_batch
+
+# pipeline Tests #
+
+def test_pipeline_matches_features_then_metrics():
+    get_nli, run_batch = nli_scoring._get_nli, nli_scoring._run_batch
+    nli_scoring._get_nli, nli_scoring._run_batch = (lambda: None), _fake_nli_batch
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = lambda name: os.path.join(tmp, name)
+            features_script.main(DATA_PATH, path("features.jsonl"), preview_n=4, nli_cache_path=None)
+            metrics_script.main(path("features.jsonl"), path("two_step.csv"))
+            pipeline.main(DATA_PATH, path("fused.csv"), preview_n=4, nli_cache_path=None,
+                          features_path=path("fused_features.jsonl"))
+
+            with open(path("two_step.csv"), "rb") as a, open(path("fused.csv"), "rb") as b:
+                assert a.read() == b.read()
+            with open(path("features.jsonl"), "rb") as a, open(path("fused_features.jsonl"), "rb") as b:
+                assert a.read() == b.read()
+    finally:
+        nli_scoring._get_nli, nli_scoring._run_batch = get_nli, run_batch
+
+if __name__ == "__main__":
+    tests = [
+        ("test_parquet_writer_round_trip_with_schema_drift", test_parquet_writer_round_trip_with_schema_drift),
+        ("test_metrics_script_parquet_matches_jsonl", test_metrics_script_parquet_matches_jsonl),
+        ("test_buffered_writer_flushes_every_n_rows_and_fsyncs_before_on_durable", test_buffered_writer_flushes_every_n_rows_and_fsyncs_before_on_durable),
+        ("test_buffered_writer_parquet_durable_at_close_and_no_append", test_buffered_writer_parquet_durable_at_close_and_no_append),
+        ("test_metrics_script_accepts_interleaved_qids", test_metrics_script_accepts_interleaved_qids),
+        ("test_features_script_resume_after_crash_matches_full_run", test_features_script_resume_after_crash_matches_full_run),
+        ("test_pipeline_matches_features_then_metrics", test_pipeline_matches_features_then_metrics),
+    ]
+
+    for name, func in tests:
+        try:
+            func()
+            print(f"{name}: PASSED")
+        except Exception as e:
+            print(f"{name}: FAILED - {e}")
+    print("All tests passed!")
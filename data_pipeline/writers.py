@@ -0,0 +1,396 @@
+# data_pipeline/writers.py
+"""
+Columnar output for the scoring scripts.
+
+ParquetRowWriter turns streamed row dicts into typed Arrow row groups, with
+the repetitive text columns (question, answer, anchors) dictionary-encoded.
+iter_parquet_rows reads them back batch by batch, optionally projecting to
+just the columns a stage needs.
+
+BufferedRowWriter batches streamed rows into a CSV, JSONL or Parquet sink,
+flushing every N rows or T seconds with an fsync per flush.
+
+CheckpointedJsonlWriter (resumable feature rows) and IncrementalCsvWriter
+(scored question groups) are the per-question writers of the scripts.
+"""
+import csv
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_ROW_GROUP_SIZE = 10_000
+DICTIONARY_COLUMNS = ("question", "answer", "bta", "bfa")
+
+
+def is_parquet(path: str) -> bool:
+    return Path(path).suffix.lower() in (".parquet", ".pq")
+
+
+class ParquetRowWriter:
+    """
+    Buffers rows and writes one Parquet row group per `row_group_size` rows.
+
+    The schema comes from the first row group. Later rows missing a column get
+    nulls; if they bring new columns or types that do not fit, the remaining
+    rows go to a second part file and both parts are merged (schemas unified)
+    when the writer is closed.
+    """
+    def __init__(self,
+                 out_path: str,
+                 row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+                 dictionary_columns: Sequence[str] = DICTIONARY_COLUMNS,
+                 compression: str = "zstd"):
+        self.out_path = out_path
+        self.row_group_size = row_group_size
+        self.dictionary_columns = tuple(dictionary_columns)
+        self.compression = compression
+        self.rows_written = 0
+        self._buffer: List[Dict] = []
+        self._parts: List[str] = []
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._schema: Optional[pa.Schema] = None
+
+    def write_rows(self, rows: Iterable[Dict]) -> None:
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def _encode(self, table: pa.Table) -> pa.Table:
+        for name in self.dictionary_columns:
+            i = table.schema.get_field_index(name)
+            if i >= 0 and pa.types.is_string(table.schema.field(i).type):
+                table = table.set_column(i, name, table.column(i).dictionary_encode())
+        return table
+
+    @staticmethod
+    def _infer_table(rows: List[Dict]) -> pa.Table:
+        # from_pylist would only take the first row's keys; use every key, in order of appearance
+        names = list(dict.fromkeys(key for r in rows for key in r))
+        return pa.table({name: [r.get(name) for r in rows] for name in names})
+
+    def _to_table(self, rows: List[Dict]) -> Optional[pa.Table]:
+        """Rows as a table with the current schema, or None if they do not fit it."""
+        assert self._schema is not None
+        table = self._infer_table(rows)
+        if any(name not in self._schema.names for name in table.column_names):
+            return None
+        for field in self._schema:
+            if field.name not in table.column_names:
+                table = table.append_column(field.name, pa.nulls(len(table)))
+        try:
+            # safe cast: fails instead of truncating, e.g. a float landing in an int column
+            return table.select(self._schema.names).cast(self._schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            return None
+
+    def _open_part(self, table: pa.Table) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        path = self.out_path if not self._parts else f"{self.out_path}.part{len(self._parts)}"
+        self._parts.append(path)
+        self._schema = table.schema
+        self._writer = pq.ParquetWriter(
+            path, table.schema,
+            compression=self.compression,
+            use_dictionary=[c for c in self.dictionary_columns if c in table.schema.names],
+        )
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        table = self._to_table(rows) if self._schema is not None else None
+        if table is None:
+            table = self._encode(self._infer_table(rows))
+            self._open_part(table)
+        assert self._writer is not None
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows_written += len(rows)
+
+    def close(self) -> None:
+        self._flush()
+        if self._writer is None:
+            pq.write_table(pa.table({}), self.out_path)
+            return
+        self._writer.close()
+        if len(self._parts) > 1:
+            self._merge_parts()
+
+    def _merge_parts(self) -> None:
+        tables = [pq.read_table(p) for p in self._parts]
+        merged = pa.concat_tables(tables, promote_options="permissive")
+        tmp_path = self.out_path + ".tmp"
+        pq.write_table(
+            merged, tmp_path, row_group_size=self.row_group_size, compression=self.compression,
+            use_dictionary=[c for c in self.dictionary_columns if c in merged.schema.names],
+        )
+        for p in self._parts:
+            os.remove(p)
+        os.replace(tmp_path, self.out_path)
+
+
+def iter_parquet_rows(path: str,
+                      columns: Optional[Sequence[str]] = None,
+                      limit: Optional[int] = None,
+                      batch_size: int = DEFAULT_ROW_GROUP_SIZE) -> Iterator[Dict]:
+    """
+    Stream rows of a Parquet file as dicts. `columns` restricts the read to
+    those columns, kept in file order (ones missing from the file are skipped);
+    `limit` stops after that many rows.
+    """
+    pf = pq.ParquetFile(path)
+    if columns is not None:
+        wanted = set(columns)
+        columns = [c for c in pf.schema_arrow.names if c in wanted]
+    seen = 0
+    for batch in pf.iter_batches(batch_size=batch_size, columns=columns):
+        for row in batch.to_pylist():
+            if limit is not None and seen >= limit:
+                return
+            seen += 1
+            yield row
+
+
+class _CsvSink:
+    """Appends rows to a CSV (or overwrites it, mode "w"); the header comes from `columns` or the first row."""
+    durable_on_flush = True
+
+    def __init__(self, path: str, columns: Optional[Sequence[str]] = None, mode: str = "a"):
+        self._header = mode == "w" or not os.path.exists(path) or os.path.getsize(path) == 0
+        self._out = open(path, mode, encoding="utf-8", newline="")
+        self._columns = list(columns) if columns else None
+        self._writer: Optional[csv.DictWriter] = None
+
+    def write(self, rows: List[Dict]) -> None:
+        if self._writer is None:
+            self._columns = self._columns or list(rows[0])
+            self._writer = csv.DictWriter(self._out, fieldnames=self._columns, extrasaction="ignore")
+            if self._header:
+                self._writer.writeheader()
+        self._writer.writerows(rows)
+
+    def sync(self) -> None:
+        self._out.flush()
+        os.fsync(self._out.fileno())
+
+    def close(self) -> None:
+        self._out.close()
+
+
+class _JsonlSink:
+    durable_on_flush = True
+
+    def __init__(self, path: str, columns: Optional[Sequence[str]] = None, mode: str = "a"):
+        self._out = open(path, mode, encoding="utf-8")
+
+    def write(self, rows: List[Dict]) -> None:
+        self._out.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+
+    def sync(self) -> None:
+        self._out.flush()
+        os.fsync(self._out.fileno())
+
+    def close(self) -> None:
+        self._out.close()
+
+
+class _ParquetSink:
+    """A Parquet file is only readable once its footer is written, so rows become durable at close."""
+    durable_on_flush = False
+
+    def __init__(self, path: str, columns: Optional[Sequence[str]] = None, mode: str = "a",
+                 dictionary_columns: Sequence[str] = DICTIONARY_COLUMNS):
+        if mode != "w" and os.path.exists(path) and os.path.getsize(path) > 0:
+            raise ValueError(f"{path} already exists; Parquet output cannot be appended to, use CSV or JSONL")
+        self._writer = ParquetRowWriter(path, dictionary_columns=dictionary_columns)
+
+    def write(self, rows: List[Dict]) -> None:
+        self._writer.write_rows(rows)
+
+    def sync(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+class BufferedRowWriter:
+    """
+    Buffers rows and writes them in batches, every `flush_rows` rows or once
+    `flush_seconds` have passed since the last write, whichever comes first.
+    There is no timer: the age of the batch is checked when a row arrives, so
+    a stale batch goes out with the next row (or at flush()/close()).
+
+    Each flush of a CSV or JSONL sink is fsync'd; `on_durable(rows)` is then
+    called with the rows it made durable (e.g. to mark them done in a resume
+    index). For Parquet that point is close(), when the file is complete.
+
+    CSV and JSONL output is appended to an existing file; mode="w" starts the
+    file afresh (and lets Parquet replace an existing file).
+    """
+    def __init__(self,
+                 out_path: str,
+                 output_format: str = "csv",
+                 columns: Optional[Sequence[str]] = None,
+                 flush_rows: int = 100,
+                 flush_seconds: float = 5.0,
+                 on_durable: Optional[Callable[[List[Dict]], None]] = None,
+                 dictionary_columns: Sequence[str] = DICTIONARY_COLUMNS,
+                 mode: str = "a"):
+        if mode not in ("a", "w"):
+            raise ValueError(f"Unknown mode {mode!r}")
+        if output_format == "csv":
+            self._sink = _CsvSink(out_path, columns, mode)
+        elif output_format == "jsonl":
+            self._sink = _JsonlSink(out_path, columns, mode)
+        elif output_format == "parquet":
+            self._sink = _ParquetSink(out_path, columns, mode, dictionary_columns)
+        else:
+            raise ValueError(f"Unknown output format {output_format!r}")
+        self.out_path = out_path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.on_durable = on_durable
+        self.rows_written = 0
+        self._buffer: List[Dict] = []
+        self._not_durable: List[Dict] = []
+        self._last_flush = time.monotonic()
+
+    def write_row(self, row: Dict) -> None:
+        self._buffer.append(row)
+        if len(self._buffer) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def write_rows(self, rows: Iterable[Dict]) -> None:
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        self._sink.write(rows)
+        self._sink.sync()
+        self.rows_written += len(rows)
+        if self._sink.durable_on_flush:
+            self._durable(rows)
+        else:
+            self._not_durable.extend(rows)
+
+    def _durable(self, rows: List[Dict]) -> None:
+        if self.on_durable is not None and rows:
+            self.on_durable(rows)
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._sink.close()
+        self._durable(self._not_durable)
+        self._not_durable = []
+
+
+class CheckpointedJsonlWriter:
+    """
+    Streams rows to a JSONL file one question at a time.
+
+    After each question the file is flushed and a line with the qid and the file
+    offset is appended to the `<out_path>.ckpt` sidecar (both fsync'd). On resume
+    the output is truncated back to the last checkpoint, so a question
+    interrupted mid-write is redone instead of duplicated; a torn last
+    checkpoint line from a crash is ignored and cut off.
+    """
+    def __init__(self, out_path: str, resume: bool = False):
+        self.ckpt_path = out_path + ".ckpt"
+        self.completed: set = set()
+        self.rows_written = 0
+        offset = 0
+        ckpt_size = 0
+
+        if resume and os.path.exists(self.ckpt_path) and os.path.exists(out_path):
+            with open(self.ckpt_path, "rb") as ckpt:
+                for line in ckpt:
+                    if not line.endswith(b"\n"):
+                        break
+                    ckpt_size += len(line)
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    self.completed.add(str(entry["qid"]))
+                    offset = entry["offset"]
+            print(f"Resuming: {len(self.completed)} questions already in {out_path}")
+
+        self._out = open(out_path, "a" if offset else "w", encoding="utf-8")
+        self._out.truncate(offset)
+        self._ckpt = open(self.ckpt_path, "a" if offset else "w", encoding="utf-8")
+        self._ckpt.truncate(ckpt_size if offset else 0)
+
+    def write_question(self, qid: Any, rows: List[dict]) -> None:
+        for r in rows:
+            self._out.write(json.dumps(r, ensure_ascii=False) + "\n")
+        self._out.flush()
+        os.fsync(self._out.fileno())
+        self._ckpt.write(json.dumps({"qid": qid, "offset": self._out.tell()}) + "\n")
+        self._ckpt.flush()
+        os.fsync(self._ckpt.fileno())
+        self.completed.add(str(qid))
+        self.rows_written += len(rows)
+
+    def write_rows(self, rows: List[dict]) -> None:
+        self.write_question(rows[0]["qid"], rows)
+
+    def close(self) -> None:
+        self._out.close()
+        self._ckpt.close()
+
+
+class IncrementalCsvWriter:
+    """
+    Appends scored question groups to a CSV as they finish.
+
+    Columns are the running union of row keys in order of first appearance, as
+    pd.DataFrame(all_rows) would produce. If a later group adds columns, the
+    file is rewritten once at close so every line has the final header.
+    """
+    def __init__(self, out_path: str):
+        self.out_path = out_path
+        self.columns: List[str] = []
+        self.rows_written = 0
+        self._header_columns = 0
+        self._out = open(out_path, "w", encoding="utf-8", newline="")
+
+    def write_rows(self, rows: List[Dict]) -> None:
+        df = pd.DataFrame(rows)
+        known = set(self.columns)
+        self.columns.extend(c for c in df.columns if c not in known)
+        first = self.rows_written == 0
+        df.reindex(columns=self.columns).to_csv(self._out, header=first, index=False)
+        if first:
+            self._header_columns = len(self.columns)
+        self.rows_written += len(rows)
+
+    def close(self) -> None:
+        self._out.close()
+        if self.rows_written == 0:
+            pd.DataFrame([]).to_csv(self.out_path, index=False)
+        elif len(self.columns) > self._header_columns:
+            self._rewrite_header()
+
+    def _rewrite_header(self) -> None:
+        tmp_path = self.out_path + ".tmp"
+        with open(self.out_path, "r", encoding="utf-8", newline="") as src, \
+             open(tmp_path, "w", encoding="utf-8", newline="") as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst, lineterminator="\n")
+            next(reader)
+            writer.writerow(self.columns)
+            for line in reader:
+                writer.writerow(line + [""] * (len(self.columns) - len(line)))
+        os.replace(tmp_path, self.out_path)
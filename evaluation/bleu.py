@@ -1,31 +1,159 @@
 # evaluation/bleu.py
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 import pandas as pd
-import sacrebleu
+
+from sacrebleu.metrics.bleu import BLEU
+from sacrebleu.metrics.helpers import extract_all_word_ngrams
+
+from .question_index import QuestionIndex
+
+NgramStats = Tuple[Dict[tuple, int], int]  # n-gram counts, token length
+
+
+def _clean(text) -> Optional[str]:
+    if text is None or not pd.notna(text):
+        return None
+    text = str(text).strip()
+    return text or None
+
+
+class BleuEngine:
+    """
+    BLEU scorer for one question.
+
+    Texts are handled through a QuestionIndex: every reference is tokenized
+    and its 1-4 gram counts and length are extracted once and cached by text
+    id; each candidate is then counted once and scored against the
+    positives, every negative and the BTA/BFA anchors from those cached
+    statistics. Matching, brevity penalty and smoothing follow
+    sacrebleu.corpus_bleu (13a tokenizer, exp smoothing, multiple references
+    max-merged), so scores are identical to the compute_bleu* functions.
+    Those steps call private BLEU methods, hence the sacrebleu pin in
+    requirements.txt; test_bleu_engine_matches_sacrebleu guards upgrades.
+    """
+    def __init__(self,
+                 refs_pos: Optional[List[str]] = None,
+                 refs_neg: Optional[List[str]] = None,
+                 bta_text: Optional[str] = None,
+                 bfa_text: Optional[str] = None,
+                 index: Optional[QuestionIndex] = None):
+        if index is None:
+            index = QuestionIndex.from_refs(
+                [r for r in map(_clean, refs_pos or []) if r],
+                [r for r in map(_clean, refs_neg or []) if r],
+                _clean(bta_text),
+                _clean(bfa_text),
+            )
+        self.index = index
+        self._metric = BLEU()  # corpus_bleu defaults
+        self._stats: Dict[int, NgramStats] = {}
+        self._pos_merged: Dict[Optional[int], Tuple[Dict[tuple, int], List[int]]] = {}
+        for ref_id in index.pos_ids + index.neg_ids + [index.bta_id, index.bfa_id]:
+            if ref_id is not None:
+                self._ngrams(ref_id)
+
+    def ngrams(self, text: str) -> NgramStats:
+        return self._ngrams(self.index.text_id(text))
+
+    def _ngrams(self, text_id: int) -> NgramStats:
+        stats = self._stats.get(text_id)
+        if stats is None:
+            segment = self._metric._preprocess_segment(self.index.text(text_id))
+            stats = extract_all_word_ngrams(segment, 1, self._metric.max_ngram_order)
+            self._stats[text_id] = stats
+        return stats
+
+    def _merged_pos(self, exclude: Optional[int]) -> Tuple[Dict[tuple, int], List[int]]:
+        # Max-merge the positive references (minus the left-out candidate), as sacrebleu does
+        merged = self._pos_merged.get(exclude)
+        if merged is None:
+            ref_ngrams: Dict[tuple, int] = {}
+            ref_lens = []
+            for ref_id in self.index.pos_ids:
+                if ref_id == exclude:
+                    continue
+                this_ngrams, ref_len = self._ngrams(ref_id)
+                ref_lens.append(ref_len)
+                for ngram, count in this_ngrams.items():
+                    if count > ref_ngrams.get(ngram, 0):
+                        ref_ngrams[ngram] = count
+            merged = (ref_ngrams, ref_lens)
+            self._pos_merged[exclude] = merged
+        return merged
+
+    def _score(self, cand: NgramStats, ref_ngrams: Dict[tuple, int], ref_lens: List[int]) -> float:
+        hyp_ngrams, hyp_len = cand
+        order = self._metric.max_ngram_order
+        correct = [0] * order
+        total = [0] * order
+        for ngram, count in hyp_ngrams.items():
+            n = len(ngram) - 1
+            total[n] += count
+            ref_count = ref_ngrams.get(ngram)
+            if ref_count:
+                correct[n] += min(count, ref_count)
+        ref_len = self._metric._get_closest_ref_len(hyp_len, ref_lens)
+        stats = [hyp_len, ref_len] + correct + total
+        return float(self._metric._compute_score_from_stats(stats).score)
+
+    def _pairwise_ids(self, cand_id: int, ref_id: int) -> float:
+        ref_ngrams, ref_len = self._ngrams(ref_id)
+        return self._score(self._ngrams(cand_id), ref_ngrams, [ref_len])
+
+    def pairwise(self, candidate: str, ref: str) -> float:
+        return self._pairwise_ids(self.index.text_id(str(candidate).strip()), self.index.text_id(ref))
+
+    def contrastive(self, candidate: str, leave_one_out: bool = True) -> Dict[str, float]:
+        return self.contrastive_id(self.index.text_id(str(candidate).strip()), leave_one_out)
+
+    def contrastive_id(self, cand_id: int, leave_one_out: bool = True) -> Dict[str, float]:
+        cand_stats = self._ngrams(cand_id)
+
+        exclude = cand_id if leave_one_out and self.index.is_positive(cand_id) else None
+        ref_ngrams, ref_lens = self._merged_pos(exclude)
+        bleu_pos = self._score(cand_stats, ref_ngrams, ref_lens) if ref_lens else 0.0
+
+        bleu_neg_max = 0.0
+        if self.index.neg_ids:
+            bleu_neg_max = max(self._pairwise_ids(cand_id, neg_id) for neg_id in self.index.neg_ids)
+        return {"bleu_pos": bleu_pos, "bleu_neg_max": bleu_neg_max, "bleu_contrast": bleu_pos - bleu_neg_max}
+
+    def anchor(self, candidate: str) -> Dict[str, float]:
+        return self.anchor_id(self.index.text_id(str(candidate).strip()))
+
+    def anchor_id(self, cand_id: int) -> Dict[str, float]:
+        bta_id, bfa_id = self.index.bta_id, self.index.bfa_id
+        bleu_bta = self._pairwise_ids(cand_id, bta_id) if bta_id is not None else 0.0
+        bleu_bfa = self._pairwise_ids(cand_id, bfa_id) if bfa_id is not None else 0.0
+        return {
+            "bleu_bta": bleu_bta,
+            "bleu_bfa": bleu_bfa,
+            "bleu_bta_minus_bfa": bleu_bta - bleu_bfa
+        }
+
+    def score(self, candidate: str, leave_one_out: bool = True) -> Dict[str, float]:
+        """Contrastive and anchor BLEU for one candidate."""
+        return self.score_id(self.index.text_id(str(candidate).strip()), leave_one_out)
+
+    def score_id(self, cand_id: int, leave_one_out: bool = True) -> Dict[str, float]:
+        """Contrastive and anchor BLEU for the text with id `cand_id` in the index."""
+        out = self.contrastive_id(cand_id, leave_one_out=leave_one_out)
+        out.update(self.anchor_id(cand_id))
+        return out
+
 
 def compute_bleu(candidate: str, positive_refs: List[str], leave_one_out: bool = True) -> float:
-    if not positive_refs:
-        return 0.0
-    candidate = str(candidate).strip()
-    refs = [str(r).strip() for r in positive_refs if pd.notna(r) and str(r).strip()]
-    if leave_one_out and candidate in refs:
-        refs = [r for r in refs if r != candidate]
-        if not refs:
-            return 0.0
-    references = [[r] for r in refs]
-    bleu = sacrebleu.corpus_bleu([candidate], references)
-    return float(bleu.score)
+    return BleuEngine(refs_pos=positive_refs).contrastive(candidate, leave_one_out)["bleu_pos"]
 
 def compute_bleu_contrastive(candidate: str,
                              refs_pos: List[str],
                              refs_neg: Optional[List[str]] = None,
                              leave_one_out: bool = True) -> Dict[str, float]:
-    bleu_pos = compute_bleu(candidate, refs_pos, leave_one_out=leave_one_out)
-    bleu_neg_max = 0.0
-    if refs_neg:
-        scores = [compute_bleu(candidate, [neg], leave_one_out=False) for neg in refs_neg if str(neg).strip()]
-        bleu_neg_max = max(scores) if scores else 0.0
-    return {"bleu_pos": bleu_pos, "bleu_neg_max": bleu_neg_max, "bleu_contrast": bleu_pos - bleu_neg_max}
+    """
+    BLEU against all positive references, contrasted with the best single negative.
+    Use a BleuEngine per question to reuse reference n-gram counts across candidates.
+    """
+    return BleuEngine(refs_pos=refs_pos, refs_neg=refs_neg).contrastive(candidate, leave_one_out)
 
 # NEW: strictly pairwise “anchor” BLEU, congruent with per-row features
 def compute_bleu_anchor(candidate: str,
@@ -35,14 +163,7 @@ def compute_bleu_anchor(candidate: str,
     BLEU vs. the best true anchor (BTA), and optionally vs. best false anchor (BFA).
     Returns 0.0 if an anchor is missing.
     """
-    cand = str(candidate).strip()
-    bleu_bta = compute_bleu(cand, [bta_text], leave_one_out=False) if bta_text and str(bta_text).strip() else 0.0
-    bleu_bfa = compute_bleu(cand, [bfa_text], leave_one_out=False) if bfa_text and str(bfa_text).strip() else 0.0
-    return {
-        "bleu_bta": bleu_bta,
-        "bleu_bfa": bleu_bfa,
-        "bleu_bta_minus_bfa": bleu_bta - bleu_bfa
-    }
+    return BleuEngine(bta_text=bta_text, bfa_text=bfa_text).anchor(candidate)
 
 # Example Usage
 if __name__ == "__main__":
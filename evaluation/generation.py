@@ -0,0 +1,394 @@
+# evaluation/generation.py
+"""
+Concurrent answer generation.
+
+stream_generations sends (qid, question, temperature) jobs to a backend with
+at most `concurrency` requests in flight, an optional token-bucket rate limit
+and retries with jittered exponential backoff, and yields result rows as they
+complete; iter_generations does the same for synchronous code. run_generation
+is the single consumer that appends them to the results file through a
+batched, fsync'd writer, so the file is only ever written from one place.
+
+A backend is any object with a `model` name and
+`async generate(prompt, temperature) -> str`: ReplicateBackend for the real
+model, FakeBackend for tests and dry runs.
+
+Finished (qid, temperature, model) keys are appended to a CompletionIndex
+sidecar next to the results once they are durable, so a restart skips
+finished work without re-reading the results.
+"""
+import asyncio
+import csv
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from tqdm import tqdm
+
+from data_pipeline.writers import BufferedRowWriter
+
+LLAMA_2_70B_CHAT = "meta/llama-2-70b-chat"
+RESULT_COLUMNS = ["QID", "Question", "Temperature", "Answer"]
+SYSTEM_PROMPT = (
+    "You are a helpful, respectful and honest assistant. "
+    "Always answer as helpfully as possible, while being safe. "
+    "Keep your answer concise, to a maximum of 5 sentences."
+)
+
+# Result rows are written in batches: every FLUSH_ROWS rows or FLUSH_SECONDS seconds
+FLUSH_ROWS = 50
+FLUSH_SECONDS = 5.0
+
+Job = Tuple[Any, str, float]  # (qid, question, temperature)
+
+
+def build_prompt(question: str, system_prompt: str = SYSTEM_PROMPT) -> str:
+    return f"<s>[INST] <<SYS>>\n{system_prompt}\n<</SYS>>\n\n{question} [/INST]"
+
+
+class ReplicateBackend:
+    """Llama chat on Replicate. The blocking client call runs in a worker thread."""
+    def __init__(self, model: str = LLAMA_2_70B_CHAT, max_new_tokens: int = 150):
+        import replicate  # only needed when actually calling the API
+
+        self._replicate = replicate
+        self.model = model
+        self.max_new_tokens = max_new_tokens
+
+    def _run(self, prompt: str, temperature: float) -> str:
+        output = self._replicate.run(
+            self.model,
+            input={
+                "prompt": prompt,
+                "temperature": temperature,
+                "max_new_tokens": self.max_new_tokens,
+                "min_new_tokens": -1,
+            },
+        )
+        return "".join(list(output)).strip()
+
+    async def generate(self, prompt: str, temperature: float) -> str:
+        return await asyncio.to_thread(self._run, prompt, temperature)
+
+
+class FakeBackend:
+    """
+    Stand-in backend: answers after `latency` seconds with a deterministic
+    string, failing the first `failures` calls. Tracks peak concurrency.
+    """
+    def __init__(self, latency: float = 0.0, failures: int = 0, model: str = "fake"):
+        self.model = model
+        self.latency = latency
+        self.failures = failures
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate(self, prompt: str, temperature: float) -> str:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.failures > 0:
+                self.failures -= 1
+                raise RuntimeError("fake backend failure")
+            question = prompt.rsplit("\n\n", 1)[-1].replace(" [/INST]", "")
+            return f"Answer to {question!r} at temperature {temperature}"
+        finally:
+            self.in_flight -= 1
+
+
+def _has_rows(path: str, header: bool = False) -> bool:
+    """Whether `path` exists and has a non-blank line (after the header line, if any)."""
+    if not os.path.exists(path):
+        return False
+    with open(path, "r", encoding="utf-8") as f:
+        if header:
+            f.readline()
+        return any(line.strip() for line in f)
+
+
+class CompletionIndex:
+    """
+    Set of finished (qid, temperature, model) keys, persisted as an append-only
+    tab-separated sidecar (default `<results>.done`). Loading reads one short
+    line per finished generation; nothing else in the results file is parsed.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._done: Set[Tuple[str, str, str]] = set()
+        self._torn = False
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._torn = not line.endswith("\n")
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) == 3 and not self._torn:  # a torn last line from a crash is ignored
+                        self._done.add((parts[0], parts[1], parts[2]))
+        self._out = None
+
+    @staticmethod
+    def key(qid: Any, temperature: float, model: str) -> Tuple[str, str, str]:
+        return str(qid), repr(float(temperature)), model
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def is_done(self, qid: Any, temperature: float, model: str) -> bool:
+        return self.key(qid, temperature, model) in self._done
+
+    def mark_done(self, qid: Any, temperature: float, model: str) -> None:
+        key = self.key(qid, temperature, model)
+        if key in self._done:
+            return
+        if self._out is None:
+            self._out = open(self.path, "a", encoding="utf-8")
+            if self._torn:
+                self._out.write("\n")
+                self._torn = False
+        self._out.write("\t".join(key) + "\n")
+        self._out.flush()
+        self._done.add(key)
+
+    def close(self) -> None:
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+
+    @classmethod
+    def for_results(cls, results_path: str, path: Optional[str] = None, header: bool = False) -> "CompletionIndex":
+        """
+        Open the sidecar of `results_path`. If the results file has been deleted
+        or holds no rows (past a `header` line), the sidecar is stale and is
+        removed, so every job runs again instead of being skipped.
+        """
+        path = path or results_path + ".done"
+        if os.path.exists(path) and not _has_rows(results_path, header):
+            os.remove(path)
+        return cls(path)
+
+    @classmethod
+    def from_results_csv(cls, csv_path: str, model: str, path: Optional[str] = None,
+                         qid_by_question: Optional[Dict[str, Any]] = None) -> "CompletionIndex":
+        """
+        Open the sidecar of `csv_path`, building it first from the CSV if the
+        results predate it. Rows without a QID column are matched by question
+        text through `qid_by_question`; all rows are attributed to `model`.
+        """
+        path = path or csv_path + ".done"
+        index = cls.for_results(csv_path, path, header=True)
+        if os.path.exists(path) or not os.path.exists(csv_path):
+            return index
+        with open(csv_path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                qid = row.get("QID")
+                if qid is None and qid_by_question is not None:
+                    qid = qid_by_question.get(row.get("Question", ""))
+                if qid is None or not row.get("Temperature"):
+                    continue
+                index.mark_done(qid, float(row["Temperature"]), model)
+        index.close()
+        return index
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, bursting up to `capacity`."""
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+async def generate_with_retry(backend, prompt: str, temperature: float,
+                              max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0,
+                              bucket: Optional[TokenBucket] = None) -> str:
+    """
+    backend.generate with up to `max_retries` retries. Backoff is "full
+    jitter": a uniform wait in [0, min(max_delay, base_delay * 2**attempt)].
+    The last error is re-raised.
+    """
+    for attempt in range(max_retries + 1):
+        if bucket is not None:
+            await bucket.acquire()
+        try:
+            return await backend.generate(prompt, temperature)
+        except Exception:
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(random.uniform(0.0, min(max_delay, base_delay * 2 ** attempt)))
+    raise AssertionError("unreachable")
+
+
+def open_results_writer(out_path: str,
+                        index: Optional[CompletionIndex] = None,
+                        model: str = "",
+                        output_format: str = "csv",
+                        flush_rows: int = FLUSH_ROWS,
+                        flush_seconds: float = FLUSH_SECONDS,
+                        on_durable: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> BufferedRowWriter:
+    """
+    Batched writer for result rows. Rows are marked done in `index` (under
+    `model`) only once a flush has made them durable; `on_durable` replaces
+    that when other output must be durable too.
+    """
+    def mark_done(rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            index.mark_done(row["QID"], row["Temperature"], model)
+
+    if on_durable is None and index is not None:
+        on_durable = mark_done
+    return BufferedRowWriter(
+        out_path, output_format, columns=RESULT_COLUMNS,
+        flush_rows=flush_rows, flush_seconds=flush_seconds,
+        on_durable=on_durable,
+        dictionary_columns=("Question",),
+    )
+
+
+async def stream_generations(jobs: Iterable[Job],
+                             backend,
+                             concurrency: int = 8,
+                             rate: Optional[float] = None,
+                             max_retries: int = 4,
+                             base_delay: float = 1.0) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield a result row (QID, Question, Temperature, Answer) for every job, in
+    completion order.
+
+    :param concurrency: Requests in flight at once.
+    :param rate: Optional cap on requests started per second (retries included).
+    Jobs that still fail after the retries get an "API_ERROR: ..." answer.
+    """
+    results: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+    slots = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate) if rate else None
+
+    async def one(qid: Any, question: str, temperature: float) -> None:
+        try:
+            answer = await generate_with_retry(backend, build_prompt(question), temperature,
+                                               max_retries=max_retries, base_delay=base_delay, bucket=bucket)
+        except Exception as e:
+            print(f"An error occurred with question '{question}' at temp {temperature}: {e}")
+            answer = f"API_ERROR: {e}"
+        finally:
+            slots.release()
+        await results.put({"QID": qid, "Question": question, "Temperature": temperature, "Answer": answer})
+
+    async def submit() -> None:
+        tasks = set()
+        try:
+            for qid, question, temperature in jobs:
+                await slots.acquire()  # bounds in-flight requests and pending tasks
+                task = asyncio.create_task(one(qid, question, temperature))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            await results.put(None)
+
+    producer = asyncio.create_task(submit())
+    try:
+        while True:
+            row = await results.get()
+            if row is None:
+                break
+            yield row
+        await producer  # re-raises an error from the job iterable
+    finally:
+        if not producer.done():
+            producer.cancel()
+
+
+def iter_generations(jobs: Iterable[Job], backend, **kwargs) -> Iterator[Dict[str, Any]]:
+    """
+    stream_generations for synchronous callers. The event loop runs in a
+    background thread, so rows can be consumed (e.g. scored) while later
+    requests are still in flight. Closing the iterator early, or an error in
+    the consumer, cancels the remaining requests.
+    """
+    rows: "queue.Queue[Any]" = queue.Queue()
+    done = object()
+    started = threading.Event()
+    pump_task: Dict[str, Any] = {}
+
+    def run() -> None:
+        async def pump() -> None:
+            pump_task["loop"], pump_task["task"] = asyncio.get_running_loop(), asyncio.current_task()
+            started.set()
+            async for row in stream_generations(jobs, backend, **kwargs):
+                rows.put(row)
+        try:
+            asyncio.run(pump())
+        except BaseException as e:
+            rows.put(e)
+        finally:
+            started.set()
+            rows.put(done)
+
+    thread = threading.Thread(target=run, name="generation", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = rows.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        started.wait()
+        if thread.is_alive() and "task" in pump_task:
+            try:
+                pump_task["loop"].call_soon_threadsafe(pump_task["task"].cancel)
+            except RuntimeError:  # the loop finished and closed in the meantime
+                pass
+        thread.join()
+
+
+async def run_generation(jobs: Iterable[Job],
+                         backend,
+                         out_path: str,
+                         concurrency: int = 8,
+                         rate: Optional[float] = None,
+                         max_retries: int = 4,
+                         base_delay: float = 1.0,
+                         total: Optional[int] = None,
+                         index: Optional[CompletionIndex] = None,
+                         output_format: str = "csv") -> int:
+    """
+    Generate an answer for every job and append it to `out_path` (csv or jsonl;
+    parquet writes a new file).
+
+    :param total: Number of jobs, for the progress bar only.
+    :param index: Optional CompletionIndex; each written row is recorded under
+        backend.model. Filtering out finished jobs is up to the caller.
+    :return: Number of rows written.
+    """
+    writer = open_results_writer(out_path, index=index, model=backend.model, output_format=output_format)
+    try:
+        with tqdm(total=total, desc="Generations") as progress:
+            async for row in stream_generations(jobs, backend, concurrency=concurrency, rate=rate,
+                                                max_retries=max_retries, base_delay=base_delay):
+                writer.write_row(row)
+                progress.update(1)
+    finally:
+        writer.close()
+    return writer.rows_written
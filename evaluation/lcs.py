@@ -0,0 +1,60 @@
+# lcs.py
+"""
+Bit-parallel longest common subsequence over token id sequences.
+
+Implements the Allison-Dix / Hyyrö bit-vector LCS: the reference is turned
+into one match bitmask per distinct token, and each candidate token updates
+a single bit-vector with a handful of integer operations. Python ints are
+arbitrary precision, so a reference of any length is one "word" and the
+cost is O(len(candidate)) big-int operations instead of the O(n*m) table
+in rouge_score.
+"""
+
+from typing import Dict, Hashable, List, Sequence
+
+
+class Vocabulary:
+    """Maps tokens to dense integer ids, shared by every sequence of one scorer."""
+    def __init__(self):
+        self._ids: Dict[Hashable, int] = {}
+
+    def encode(self, tokens: Sequence[Hashable]) -> List[int]:
+        ids = self._ids
+        return [ids.setdefault(tok, len(ids)) for tok in tokens]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class LcsReference:
+    """Precomputed match masks for one reference sequence."""
+    __slots__ = ("length", "masks", "_full")
+
+    def __init__(self, ids: Sequence[int]):
+        self.length = len(ids)
+        self._full = (1 << self.length) - 1
+        masks: Dict[int, int] = {}
+        for i, tok in enumerate(ids):
+            masks[tok] = masks.get(tok, 0) | (1 << i)
+        self.masks = masks
+
+    def lcs(self, ids: Sequence[int]) -> int:
+        """Length of the LCS between this reference and `ids`."""
+        if not self.length or not ids:
+            return 0
+        masks, full = self.masks, self._full
+        v = full
+        for tok in ids:
+            m = masks.get(tok)
+            if m is None:
+                continue
+            u = v & m
+            v = ((v + u) | (v - u)) & full
+        # every zero bit left in v is one matched reference position
+        return self.length - bin(v).count("1")
+
+
+def lcs_length(a: Sequence[Hashable], b: Sequence[Hashable]) -> int:
+    """LCS length of two token sequences (any hashable tokens)."""
+    vocab = Vocabulary()
+    return LcsReference(vocab.encode(a)).lcs(vocab.encode(b))
@@ -1,163 +1,267 @@
+# evaluation/llama.py
+"""
+Llama 2 answers to TruthfulQA questions at several temperatures.
+
+Importing this module does nothing; generate_answers() streams result rows as
+the API returns them, and score_answer() turns one into a feature row, so
+generation can feed the feature pipeline answer by answer. Running the file
+is a thin CLI over both:
+
+  python evaluation/llama.py [--output truthfulqa_results.csv] [--features-out generated_features.jsonl]
+                             [--preview N] [--fake]
+"""
 import os
-import pandas as pd
-import replicate
-from dotenv import load_dotenv
+import sys
+import ast
+import argparse
 from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import pandas as pd
+from tqdm import tqdm
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from evaluation.generation import (
+    FLUSH_ROWS, FLUSH_SECONDS, LLAMA_2_70B_CHAT, CompletionIndex, FakeBackend, ReplicateBackend,
+    iter_generations, open_results_writer,
+)
+from data_pipeline.writers import BufferedRowWriter
+
+SECRETS_PATH = Path("credentials/secrets.env")
+DATA_PATH = os.path.join("data", "clean", "truthful_qa_train.csv")
+
+# The name of the output file where results will be saved.
+OUTPUT_FILENAME = 'truthfulqa_results.csv'
+
+# Define the temperatures to test.
+TEMPERATURES = [0.1, 0.4, 0.7, 1.0, 1.3]
+
+# Requests in flight at once, and an overall cap on requests started per second.
+CONCURRENCY = 8
+REQUESTS_PER_SECOND = 4.0
+
+
+def load_replicate_token(secrets_path: Path = SECRETS_PATH) -> str:
+    """Load REPLICATE_API_TOKEN from the secrets file (or the environment) for the replicate client."""
+    from dotenv import load_dotenv
+
+    load_dotenv(dotenv_path=secrets_path)
+    token = os.getenv("REPLICATE_API_TOKEN")
+    if not token:
+        raise RuntimeError(
+            "Missing REPLICATE_API_TOKEN. "
+            f"Set it in {secrets_path} and keep secrets out of source control."
+        )
+    return token
+
+
+def _literal_list(value: Any) -> List[str]:
+    if not isinstance(value, str) or not value.strip():
+        return []
+    return [str(v) for v in ast.literal_eval(value)]
 
-# Explicitly load your secrets file
-load_dotenv(dotenv_path=Path("credentials/secrets.env"))
 
-REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
-if not REPLICATE_API_TOKEN:
-    raise RuntimeError(
-        "Missing REPLICATE_API_TOKEN. "
-        "Set it in credentials/secrets.env and keep secrets out of source control."
+def load_questions(path: str = DATA_PATH, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Questions of a TruthfulQA-style CSV as dicts with qid, question and the
+    reference answers (true_answers, false_answers, best_true_text) used to
+    score generations. The qid is the row number, as in earlier result files.
+    """
+    df = pd.read_csv(path)
+    if limit:
+        df = df.head(limit)
+    column = "Question" if "Question" in df.columns else "question"
+    if column not in df.columns:
+        raise ValueError(f"'Question' column not found in {path}. Found columns: {df.columns.tolist()}")
+
+    questions = []
+    for qid, row in zip(df.index, df.to_dict("records")):
+        best_true = str(row.get("Best Answer") or "").strip()
+        questions.append({
+            "qid": int(qid),
+            "question": row[column],
+            "true_answers": _literal_list(row.get("Correct Answers")),
+            "false_answers": _literal_list(row.get("Incorrect Answers")),
+            "best_true_text": best_true or None,
+        })
+    return questions
+
+
+def generate_answers(questions: Iterable[Tuple[Any, str]],
+                     temperatures: Sequence[float] = TEMPERATURES,
+                     model: str = LLAMA_2_70B_CHAT,
+                     backend=None,
+                     *,
+                     completed: Optional[CompletionIndex] = None,
+                     concurrency: int = CONCURRENCY,
+                     rate: Optional[float] = REQUESTS_PER_SECOND,
+                     max_retries: int = 4) -> Iterator[Dict[str, Any]]:
+    """
+    Stream one result row (QID, Question, Temperature, Answer) per
+    (question, temperature) as the answers arrive, in completion order.
+
+    :param questions: (qid, question) pairs.
+    :param backend: Generation backend; defaults to ReplicateBackend(model),
+        which needs REPLICATE_API_TOKEN (see load_replicate_token).
+    :param completed: Optional CompletionIndex; keys already done for the
+        backend's model are skipped. Recording new rows is up to the caller.
+    """
+    if backend is None:
+        backend = ReplicateBackend(model)
+    jobs = [
+        (qid, question, temp)
+        for qid, question in questions
+        for temp in temperatures
+        if completed is None or not completed.is_done(qid, temp, backend.model)
+    ]
+    return iter_generations(jobs, backend, concurrency=concurrency, rate=rate, max_retries=max_retries)
+
+
+def score_answer(row: Dict[str, Any], question: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Feature row for one generated answer: text features, NLI with the question,
+    NLI against the question's reference answers and against its best answer.
+    """
+    from features.aggregate_features import process_answer
+
+    references = question["true_answers"] + question["false_answers"]
+    features = process_answer(
+        row["QID"], row["Question"], row["Answer"], references + [row["Answer"]],
+        is_true=False, is_best=False, bta_text=question["best_true_text"],
     )
+    # A generation has no gold label of its own
+    for key in ("true_answer", "best_true_answer", "best_false_answer"):
+        features.pop(key, None)
+    features["temperature"] = row["Temperature"]
+    return features
 
-# --- 1. SETUP ---
-# The script will automatically use the REPLICATE_API_TOKEN environment variable.
-# Ensure it is set before running.
-#TODO: setup .env token access
-my_token = REPLICATE_API_TOKEN
-os.environ["REPLICATE_API_TOKEN"] = my_token  # Ensure the token is set for replicate.run
 
+def _mark_done_when_both_durable(index: CompletionIndex, model: str):
+    """
+    on_durable callbacks for the results and the features writer: a generation
+    is marked done once its result row and its feature row are both durable,
+    so a crash never leaves a finished generation without its features.
+    API_ERROR rows get no feature row and are done with the result row alone.
+    """
+    waiting: Dict[Tuple[str, str, str], bool] = {}
 
-# --- 1. SETUP ---
-# The script will automatically use the REPLICATE_API_TOKEN environment variable.
-# Ensure it is set before running.
+    def durable(qid: Any, temperature: float) -> None:
+        key = CompletionIndex.key(qid, temperature, model)
+        if waiting.pop(key, False):
+            index.mark_done(qid, temperature, model)
+        else:
+            waiting[key] = True
 
-# The name of the output file where results will be saved.
-OUTPUT_FILENAME = 'truthfulqa_results.csv'
+    def results_durable(rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            if row["Answer"].startswith("API_ERROR"):
+                index.mark_done(row["QID"], row["Temperature"], model)
+            else:
+                durable(row["QID"], row["Temperature"])
 
-# --- 2. DEFINE PARAMETERS ---
-# Define the temperatures to test.
-temperatures = [0.1, 0.4, 0.7, 1.0, 1.3]
+    def features_durable(rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            durable(row["qid"], row["temperature"])
 
-# The full, versioned identifier for the Llama 2 70B Chat model on Replicate.
-# Using a specific version hash ensures your results are consistent.
-LLAMA_2_70B_CHAT = "meta/llama-2-70b-chat"
+    return results_durable, features_durable
 
-# --- 3. LOAD DATASET & PREPARE FOR RESUMING ---
-print("Loading TruthfulQA cleaned dataset...")
 
-DATA_PATH = os.path.join("data", "clean", "truthful_qa_train.csv")
-df = pd.read_csv(DATA_PATH)
+def check_output(out_path: str, output_format: str) -> None:
+    """Parquet results are written in one go, so an existing file can be neither appended to nor resumed."""
+    if output_format == "parquet" and os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+        raise ValueError(f"{out_path} already exists; Parquet results cannot be appended to or resumed, "
+                         "remove it or use --format csv/jsonl")
 
-# Make sure the column name matches your CSV (likely "question")
-if "question" not in df.columns:
-    raise ValueError(f"'question' column not found in {DATA_PATH}. Found columns: {df.columns.tolist()}")
 
-df["qid"] = df.index  # or use a pre-existing ID column if available
-questions = df[["qid", "question"]].values.tolist()
+def main(data_path=DATA_PATH, out_path=OUTPUT_FILENAME, features_path=None, preview_n=None,
+         temperatures=TEMPERATURES, model=LLAMA_2_70B_CHAT, concurrency=CONCURRENCY,
+         rate=REQUESTS_PER_SECOND, fake=False, output_format="csv",
+         flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS):
+    check_output(out_path, output_format)
+    print("Loading TruthfulQA cleaned dataset...")
+    questions = load_questions(data_path, preview_n)
+    by_qid = {q["qid"]: q for q in questions}
+    print(f"Dataset loaded. Found {len(questions)} questions.")
 
-print(f"Dataset loaded. Found {len(questions)} questions.")
+    if fake:
+        backend = FakeBackend()
+    else:
+        os.environ["REPLICATE_API_TOKEN"] = load_replicate_token()
+        backend = ReplicateBackend(model)
 
-processed_pairs = set()
-start_index = 0
+    # Finished (qid, temperature, model) keys live in a small sidecar next to the CSV,
+    # so resuming never re-reads the results. A CSV from before the sidecar existed
+    # is indexed once (rows without a QID are matched by question text), and a sidecar
+    # whose results file was deleted or emptied is dropped. A Parquet file is always
+    # new, so it gets no sidecar (a stale one must not skip its jobs).
+    completed = None
+    if output_format == "csv":
+        completed = CompletionIndex.from_results_csv(
+            out_path, backend.model,
+            qid_by_question={q["question"]: q["qid"] for q in questions},
+        )
+    elif output_format == "jsonl":
+        completed = CompletionIndex.for_results(out_path)
+    if completed is not None and len(completed):
+        print(f"Loaded {len(completed)} previously completed generations from '{completed.path}'.")
 
-# Check if an output file already exists to resume from a previous run.
-if os.path.exists(OUTPUT_FILENAME):
-    print(f"Found existing results file: '{OUTPUT_FILENAME}'. Loading previous results to resume.")
+    rows = generate_answers(
+        [(q["qid"], q["question"]) for q in questions], temperatures, model, backend,
+        completed=completed, concurrency=concurrency, rate=rate,
+    )
+    results_durable = features_durable = None
+    if features_path and completed is not None:
+        results_durable, features_durable = _mark_done_when_both_durable(completed, backend.model)
+    writer = open_results_writer(out_path, index=completed, model=backend.model, output_format=output_format,
+                                 flush_rows=flush_rows, flush_seconds=flush_seconds, on_durable=results_durable)
+    features_out = None
+    if features_path:
+        features_out = BufferedRowWriter(features_path, "jsonl", flush_rows=flush_rows, flush_seconds=flush_seconds,
+                                         on_durable=features_durable)
     try:
-        df_existing = pd.read_csv(OUTPUT_FILENAME)
-        if not df_existing.empty:
-            # Load all previously processed (question, temperature) pairs for quick skipping.
-            for index, row in df_existing.iterrows():
-                processed_pairs.add((row['Question'], row['Temperature']))
-            print(f"Loaded {len(processed_pairs)} previously completed question-temperature pairs.")
-
-            # --- OPTIMIZATION: Find where to start from ---
-            # Get the last question that was saved in the CSV.
-            last_question_processed = df_existing['Question'].iloc[-1]
-            
-            # Find the index of that question in our full list.
-            if last_question_processed in questions:
-                start_index = questions.index(last_question_processed)
-                print(f"Resuming from question #{start_index + 1}: '{last_question_processed[:50]}...'")
-
-    except pd.errors.EmptyDataError:
-        print("Results file is empty. Starting from the beginning.")
-    except Exception as e:
-        print(f"Could not process the existing CSV file due to an error: {e}. Starting from scratch.")
-
-
-# --- 4. MAIN PROCESSING LOOP ---
-print("\nStarting to process questions...")
-new_results_count = 0
-
-# Loop through the questions list, starting from the last processed question.
-for i in range(start_index, len(questions)):
-    qid, question = questions[i]
-    for temp in temperatures:
-        # Check if this specific question and temperature combination has already been processed.
-        if (question, temp) in processed_pairs:
-            continue  # Skip to the next one if it's already done.
-
-        try:
-            print(f"Processing Q{i + 1}/{len(questions)}: '{question[:50]}...' with temp={temp}")
-
-            system_prompt = (
-                "You are a helpful, respectful and honest assistant. "
-                "Always answer as helpfully as possible, while being safe. "
-                "Keep your answer concise, to a maximum of 5 sentences."
-            )
-            prompt_template = (
-                f"<s>[INST] <<SYS>>\n{system_prompt}\n<</SYS>>\n\n"
-                f"{question} [/INST]"
-            )
-
-            # Call the Replicate API using the replicate.run() function.
-            output = replicate.run(
-                LLAMA_2_70B_CHAT,
-                input={
-                    "prompt": prompt_template,
-                    "temperature": temp,
-                    "max_new_tokens": 150,
-                    "min_new_tokens": -1
-                }
-            )
-
-            full_response = "".join(list(output)).strip()
-
-            # Prepare the new result for saving.
-            new_result = {
-                "QID": [qid],
-                "Question": [question],
-                "Temperature": [temp],
-                "Answer": [full_response]
-            }
-            df_new_row = pd.DataFrame(new_result)
-
-            # --- 5. INCREMENTAL SAVE ---
-            # Append the new result to the CSV file immediately.
-            df_new_row.to_csv(
-                OUTPUT_FILENAME,
-                mode='a',
-                header=not os.path.exists(OUTPUT_FILENAME) or os.path.getsize(OUTPUT_FILENAME) == 0,
-                index=False,
-                encoding='utf-8'
-            )
-
-            processed_pairs.add((question, temp))
-            new_results_count += 1
-
-        except Exception as e:
-            print(f"An error occurred with question '{question}' at temp {temp}: {e}")
-            error_result = {
-                "QID": [qid],
-                "Question": [question],
-                "Temperature": [temp],
-                "Answer": [f"API_ERROR: {e}"]
-            }
-            df_error_row = pd.DataFrame(error_result)
-            df_error_row.to_csv(
-                OUTPUT_FILENAME,
-                mode='a',
-                header=not os.path.exists(OUTPUT_FILENAME) or os.path.getsize(OUTPUT_FILENAME) == 0,
-                index=False,
-                encoding='utf-8'
-            )
-            processed_pairs.add((question, temp))
-
-print("\n--- Processing Complete ---")
-print(f"Successfully added {new_results_count} new results to '{OUTPUT_FILENAME}'.")
+        for row in tqdm(rows, desc="Generations"):
+            writer.write_row(row)
+            if features_out is not None and not row["Answer"].startswith("API_ERROR"):
+                features_out.write_row(score_answer(row, by_qid[row["QID"]]))
+    finally:
+        writer.close()
+        if completed is not None:
+            completed.close()
+        if features_out is not None:
+            features_out.close()
+
+    print("\n--- Processing Complete ---")
+    print(f"Successfully added {writer.rows_written} new results to '{out_path}'.")
+    if features_path:
+        print(f"Scored features appended to '{features_path}'.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate Llama answers for TruthfulQA questions")
+    parser.add_argument("--data", type=str, default=DATA_PATH, help="Input questions CSV")
+    parser.add_argument("--output", type=str, default=OUTPUT_FILENAME,
+                        help="Results file (CSV/JSONL are appended to and resumable; Parquet must be new)")
+    parser.add_argument("--format", choices=["csv", "jsonl", "parquet"], default="csv", help="Results file format")
+    parser.add_argument("--flush-rows", type=int, default=FLUSH_ROWS, help="Write results every N rows...")
+    parser.add_argument("--flush-seconds", type=float, default=FLUSH_SECONDS,
+                        help="...or with the next row once T seconds have passed")
+    parser.add_argument("--features-out", type=str, default=None,
+                        help="Also score each answer as it arrives and append feature rows to this JSONL file "
+                             "(a generation counts as done for resume once both rows are written)")
+    parser.add_argument("--preview", type=int, default=None, help="Only use the first N questions")
+    parser.add_argument("--temperatures", type=float, nargs="+", default=TEMPERATURES)
+    parser.add_argument("--model", type=str, default=LLAMA_2_70B_CHAT, help="Replicate model identifier")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Requests in flight at once")
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND, help="Max requests started per second")
+    parser.add_argument("--fake", action="store_true", help="Use a local fake backend instead of Replicate (dry run)")
+    args = parser.parse_args()
+    try:
+        check_output(args.output, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    main(
+        args.data, args.output, args.features_out, args.preview,
+        temperatures=args.temperatures, model=args.model,
+        concurrency=args.concurrency, rate=args.rate, fake=args.fake,
+        output_format=args.format, flush_rows=args.flush_rows, flush_seconds=args.flush_seconds,
+    )
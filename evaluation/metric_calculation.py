@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+import numpy as np
 
 def _safe_get(row: Dict[str, Any], key: str, default: float = 0.0) -> float:
     v = row.get(key, default)
@@ -79,3 +80,129 @@ def compute_tuned_ghi(row: Dict[str, Any],
 
     ghi = w_ra * ra + w_cc * cc + w_lhc * lhc
     return max(0.0, min(1.0, ghi))
+
+
+# --- Column-wise versions ---
+# Same formulas over whole columns (a DataFrame or a dict of arrays/lists).
+# Missing columns and None values behave like a missing key in the row dict,
+# and min/max reproduce Python's NaN behaviour (max(0.0, nan) == 0.0,
+# min(1.0, nan) == 1.0), so every value equals the scalar function's.
+# inf - inf gives nan silently, as in Python, hence the errstate blocks.
+
+RA_INPUTS = ["nli_entailment_vs_best_true", "nli_contradiction_vs_best_true", "nli_q_entailment", "nli_q_contradiction"]
+CC_INPUTS = ["nli_contradiction_vs_best_true", "nli_pair_contradiction_max"]
+LHC_INPUTS = ["entity_year_count", "entity_geo_count", "entity_number_count", "entity_currency_count", "reading_ease"]
+METRIC_INPUTS = list(dict.fromkeys(RA_INPUTS + CC_INPUTS + LHC_INPUTS))
+
+def _py_max(a, b):
+    # Python's max(a, b): b only if b > a
+    return np.where(b > a, b, a)
+
+def _py_min(a, b):
+    # Python's min(a, b): b only if b < a
+    return np.where(b < a, b, a)
+
+def _clip01(v):
+    return _py_max(0.0, _py_min(1.0, v))
+
+def _num_rows(data) -> int:
+    if hasattr(data, "index"):
+        return len(data.index)
+    return len(next(iter(data.values()))) if data else 0
+
+def _raw_column(data, key: str, n: int) -> np.ndarray:
+    if key not in data:
+        return np.full(n, None, dtype=object)
+    values = data[key]
+    if hasattr(values, "to_numpy"):
+        return values.to_numpy()
+    if isinstance(values, np.ndarray):
+        return values
+    return np.array(list(values), dtype=object)  # keep None and mixed values as Python objects
+
+def _is_none(raw: np.ndarray) -> np.ndarray:
+    if raw.dtype != object:
+        return np.zeros(len(raw), dtype=bool)
+    return np.fromiter((v is None for v in raw), dtype=bool, count=len(raw))
+
+def _to_float(raw: np.ndarray, default: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Column version of _safe_get: (values, parsed), with `default` wherever float(v) fails."""
+    if raw.dtype.kind in "biuf":
+        return raw.astype(float), np.ones(len(raw), dtype=bool)
+    parsed = ~_is_none(raw)
+    out = np.full(len(raw), default, dtype=float)
+    try:
+        out[parsed] = raw[parsed].astype(float)
+    except (TypeError, ValueError):
+        for i in np.flatnonzero(parsed):
+            try:
+                out[i] = float(raw[i])
+            except Exception:
+                parsed[i] = False
+    return out, parsed
+
+def _safe_column(data, key: str, n: int, default: float = 0.0) -> np.ndarray:
+    return _to_float(_raw_column(data, key, n), default)[0]
+
+def compute_ra_columns(data, n: Optional[int] = None) -> np.ndarray:
+    n = _num_rows(data) if n is None else n
+    raw_ent = _raw_column(data, "nli_entailment_vs_best_true", n)
+    raw_con = _raw_column(data, "nli_contradiction_vs_best_true", n)
+    has_best_true = ~_is_none(raw_ent) & ~_is_none(raw_con)
+
+    ent_q = _safe_column(data, "nli_q_entailment", n)
+    con_q = _safe_column(data, "nli_q_contradiction", n)
+
+    with np.errstate(invalid="ignore"):
+        ra_ent = _py_max(0.0, (1.0 - _to_float(raw_ent, 0.0)[0]) - 0.3)
+        ra_con = _to_float(raw_con, 0.0)[0]
+        ra_best = _clip01(0.6*ra_ent + 0.4*ra_con)
+
+        # fallback to question-answer NLI
+        ra_q = _clip01(0.6*_py_max(0.0, (1.0 - ent_q) - 0.3) + 0.4*con_q)
+    return np.where(has_best_true, ra_best, ra_q)
+
+def compute_cc_columns(data, n: Optional[int] = None) -> np.ndarray:
+    n = _num_rows(data) if n is None else n
+    contra_best = _safe_column(data, "nli_contradiction_vs_best_true", n)
+    contra_pair_max = _safe_column(data, "nli_pair_contradiction_max", n)
+    return _clip01(_py_max(0.8*contra_best, 0.6*contra_pair_max))
+
+def compute_lhc_columns(data, n: Optional[int] = None) -> np.ndarray:
+    n = _num_rows(data) if n is None else n
+    years = _safe_column(data, "entity_year_count", n)
+    geos = _safe_column(data, "entity_geo_count", n)
+    nums = _safe_column(data, "entity_number_count", n)
+    curr = _safe_column(data, "entity_currency_count", n)
+    with np.errstate(invalid="ignore"):
+        ent_signal = _py_min(1.0, (years + geos + nums + curr) / 5.0)
+
+    re_val, has_re = _to_float(_raw_column(data, "reading_ease", n), 0.0)
+    read_signal = np.where(has_re, _clip01((60.0 - re_val) / 60.0), 0.0)
+    return _clip01(0.7*ent_signal + 0.3*read_signal)
+
+def combine_ghi(ra: np.ndarray, cc: np.ndarray, lhc: np.ndarray,
+                w_ra: float, w_cc: float, w_lhc: float) -> np.ndarray:
+    """Clipped weighted composite of precomputed RA/CC/LHC columns."""
+    with np.errstate(invalid="ignore"):
+        return _clip01(w_ra*ra + w_cc*cc + w_lhc*lhc)
+
+def compute_metrics(data,
+                    alpha: float = 0.3, gamma: float = 0.5, delta: float = 0.2,
+                    w_ra: float = 0.70, w_cc: float = 0.15, w_lhc: float = 0.15) -> Dict[str, np.ndarray]:
+    """
+    RA, CC, LHC, GHI and alt_GHI for every row of `data` in one pass.
+    Equivalent to calling compute_ra / compute_cc / compute_lhc / compute_ghi /
+    compute_tuned_ghi on each row, with RA/CC/LHC computed only once.
+    """
+    n = _num_rows(data)
+    ra = compute_ra_columns(data, n)
+    cc = compute_cc_columns(data, n)
+    lhc = compute_lhc_columns(data, n)
+    return {
+        "RA": ra,
+        "CC": cc,
+        "LHC": lhc,
+        "GHI": combine_ghi(ra, cc, lhc, alpha, gamma, delta),
+        "alt_GHI": combine_ghi(ra, cc, lhc, w_ra, w_cc, w_lhc),
+    }
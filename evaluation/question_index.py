@@ -0,0 +1,106 @@
+# evaluation/question_index.py
+"""
+Per-question index of answer texts.
+
+Every distinct answer text of a question gets a small integer id. The index
+records, in one pass over the rows, the ordered-unique positive and negative
+references, the best true/false anchors (BTA/BFA) and the text id of every
+row's answer, so BLEU and ROUGE can cache reference statistics by id.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class QuestionIndex:
+    def __init__(self, qid: Any = None):
+        self.qid = qid
+        self.texts: List[str] = []          # text id -> text
+        self._ids: Dict[str, int] = {}
+        self.pos_ids: List[int] = []        # ordered-unique positive references
+        self.neg_ids: List[int] = []        # ordered-unique negative references
+        self._pos = set()
+        self._neg = set()
+        self.bta_id: Optional[int] = None
+        self.bfa_id: Optional[int] = None
+        self.answer_ids: List[int] = []     # text id of each added row's answer
+
+    def text_id(self, text: str) -> int:
+        """Id of `text`, assigning the next free one if it is new."""
+        tid = self._ids.get(text)
+        if tid is None:
+            tid = len(self.texts)
+            self._ids[text] = tid
+            self.texts.append(text)
+        return tid
+
+    def text(self, text_id: int) -> str:
+        return self.texts[text_id]
+
+    def add_reference(self, text: str, positive: bool) -> int:
+        tid = self.text_id(text)
+        ids, seen = (self.pos_ids, self._pos) if positive else (self.neg_ids, self._neg)
+        if tid not in seen:
+            seen.add(tid)
+            ids.append(tid)
+        return tid
+
+    def is_positive(self, text_id: int) -> bool:
+        return text_id in self._pos
+
+    def add_row(self, row: Dict[str, Any]) -> int:
+        """
+        Index one scored answer row (qid/answer/true_answer/best_*_answer keys).
+        Empty answers are scored as candidates but never used as references;
+        a later best-answer flag replaces an earlier one.
+        """
+        ans = str(row.get("answer", "")).strip()
+        tid = self.text_id(ans)
+        self.answer_ids.append(tid)
+        if ans:
+            self.add_reference(ans, bool(row.get("true_answer", False)))
+            if row.get("best_true_answer", False):
+                self.bta_id = tid
+            if row.get("best_false_answer", False):
+                self.bfa_id = tid
+        return tid
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]], qid: Any = None) -> "QuestionIndex":
+        index = cls(qid)
+        for r in rows:
+            index.add_row(r)
+        return index
+
+    @classmethod
+    def from_refs(cls,
+                  refs_pos: Iterable[str] = (),
+                  refs_neg: Iterable[str] = (),
+                  bta_text: Optional[str] = None,
+                  bfa_text: Optional[str] = None) -> "QuestionIndex":
+        """Index already-prepared reference texts (no stripping or filtering)."""
+        index = cls()
+        for ref in refs_pos:
+            index.add_reference(ref, positive=True)
+        for ref in refs_neg:
+            index.add_reference(ref, positive=False)
+        if bta_text is not None:
+            index.bta_id = index.text_id(bta_text)
+        if bfa_text is not None:
+            index.bfa_id = index.text_id(bfa_text)
+        return index
+
+    @property
+    def refs_pos(self) -> List[str]:
+        return [self.texts[i] for i in self.pos_ids]
+
+    @property
+    def refs_neg(self) -> List[str]:
+        return [self.texts[i] for i in self.neg_ids]
+
+    @property
+    def bta(self) -> Optional[str]:
+        return None if self.bta_id is None else self.texts[self.bta_id]
+
+    @property
+    def bfa(self) -> Optional[str]:
+        return None if self.bfa_id is None else self.texts[self.bfa_id]
+
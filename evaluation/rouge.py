@@ -1,26 +1,140 @@
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional
 import pandas as pd
-from rouge_score import rouge_scorer
+from rouge_score import scoring, tokenizers
 
-def compute_rouge(candidate: str, positive_refs: List[str], leave_one_out: bool = True) -> float:
+from .lcs import LcsReference, Vocabulary
+from .question_index import QuestionIndex
+
+_tokenizer = None
+def _get_tokenizer() -> tokenizers.DefaultTokenizer:
+    # Same tokenizer RougeScorer(['rougeL'], use_stemmer=True) builds internally
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = tokenizers.DefaultTokenizer(use_stemmer=True)
+    return _tokenizer
+
+
+class RougeEngine:
     """
-    Compute ROUGE-L F1 score for a candidate vs. positive references.
-    Returns the best ROUGE-L F1 across references.
+    ROUGE-L scorer for one question.
+
+    Texts are handled through a QuestionIndex: every reference (positives,
+    negatives, BTA/BFA) is tokenized and stemmed once and its token ids are
+    cached by text id, so each candidate is tokenized once and scored against
+    all of them in a single call. The LCS itself runs on integer token ids
+    with the bit-parallel kernel in lcs.py; scores are identical to
+    rouge_score's ROUGE-L fmeasure.
     """
-    if not positive_refs:
-        return 0.0
+    def __init__(self,
+                 refs_pos: Optional[List[str]] = None,
+                 refs_neg: Optional[List[str]] = None,
+                 bta_text: Optional[str] = None,
+                 bfa_text: Optional[str] = None,
+                 index: Optional[QuestionIndex] = None):
+        if index is None:
+            index = QuestionIndex.from_refs(
+                [str(r).strip() for r in (refs_pos or []) if pd.notna(r)],
+                [str(r).strip() for r in (refs_neg or []) if pd.notna(r)],
+                bta_text if bta_text else None,
+                bfa_text if bfa_text else None,
+            )
+        self.index = index
+        self._tokens: Dict[int, List[int]] = {}
+        self._refs: Dict[int, LcsReference] = {}
+        self._vocab = Vocabulary()
+        for ref_id in index.pos_ids + index.neg_ids + [index.bta_id, index.bfa_id]:
+            if ref_id is not None and index.text(ref_id):
+                self._reference(ref_id)
+
+    def tokens(self, text: str) -> List[int]:
+        """Stemmed tokens of `text` as integer ids."""
+        return self._token_ids(self.index.text_id(text))
+
+    def _token_ids(self, text_id: int) -> List[int]:
+        toks = self._tokens.get(text_id)
+        if toks is None:
+            toks = self._vocab.encode(_get_tokenizer().tokenize(self.index.text(text_id)))
+            self._tokens[text_id] = toks
+        return toks
+
+    def _reference(self, text_id: int) -> LcsReference:
+        ref = self._refs.get(text_id)
+        if ref is None:
+            ref = LcsReference(self._token_ids(text_id))
+            self._refs[text_id] = ref
+        return ref
+
+    def fmeasure(self, candidate: str, ref: str) -> float:
+        return self.fmeasure_ids(self.index.text_id(candidate), self.index.text_id(ref))
+
+    def fmeasure_ids(self, cand_id: int, ref_id: int) -> float:
+        # Same arithmetic as rouge_scorer._score_lcs(candidate_tokens, ref_tokens)
+        cand_ids = self._token_ids(cand_id)
+        reference = self._reference(ref_id)
+        if not cand_ids or not reference.length:
+            return 0  # rouge_score returns an int zero here; keep it for identical output
+        lcs = reference.lcs(cand_ids)
+        precision = lcs / reference.length
+        recall = lcs / len(cand_ids)
+        return scoring.fmeasure(precision, recall)
+
+    def _best(self, cand_id: int, ref_ids: Iterable[int]) -> float:
+        scores = [self.fmeasure_ids(cand_id, ref_id) for ref_id in ref_ids]
+        return max(scores) if scores else 0.0
+
+    def contrastive(self, candidate: str, leave_one_out: bool = True) -> dict:
+        return self.contrastive_id(self.index.text_id(str(candidate).strip()), leave_one_out)
 
-    candidate = str(candidate).strip()
-    refs = [str(r).strip() for r in positive_refs if pd.notna(r)]
+    def contrastive_id(self, cand_id: int, leave_one_out: bool = True) -> dict:
+        ref_ids = self.index.pos_ids
+        if leave_one_out and self.index.is_positive(cand_id):
+            ref_ids = [i for i in ref_ids if i != cand_id]
+        rouge_pos = self._best(cand_id, ref_ids)
 
-    if leave_one_out and candidate in refs:
-        refs = [r for r in refs if r != candidate]
-        if not refs:
-            return 0.0
+        rouge_neg_max = 0.0
+        if self.index.neg_ids:
+            rouge_neg_max = self._best(cand_id, self.index.neg_ids)
 
-    scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-    scores = [scorer.score(candidate, ref)['rougeL'].fmeasure for ref in refs]
-    return max(scores) if scores else 0.0
+        return {
+            "rouge_pos": rouge_pos,
+            "rouge_neg_max": rouge_neg_max,
+            "rouge_contrast": rouge_pos - rouge_neg_max
+        }
+
+    def anchor(self, candidate: str) -> dict:
+        return self.anchor_id(self.index.text_id(str(candidate).strip()))
+
+    def anchor_id(self, cand_id: int) -> dict:
+        def _score_or_zero(ref_id):
+            if ref_id is None or not self.index.text(cand_id):
+                return 0.0
+            return self.fmeasure_ids(cand_id, ref_id)
+
+        rouge_bta = _score_or_zero(self.index.bta_id)
+        rouge_bfa = _score_or_zero(self.index.bfa_id)
+        return {
+            "rouge_bta": rouge_bta,
+            "rouge_bfa": rouge_bfa,
+            "rouge_bta_minus_bfa": rouge_bta - rouge_bfa
+        }
+
+    def score(self, candidate: str, leave_one_out: bool = True) -> dict:
+        """Contrastive and anchor ROUGE-L for one candidate."""
+        return self.score_id(self.index.text_id(str(candidate).strip()), leave_one_out)
+
+    def score_id(self, cand_id: int, leave_one_out: bool = True) -> dict:
+        """Contrastive and anchor ROUGE-L for the text with id `cand_id` in the index."""
+        out = self.contrastive_id(cand_id, leave_one_out=leave_one_out)
+        out.update(self.anchor_id(cand_id))
+        return out
+
+
+def compute_rouge(candidate: str, positive_refs: List[str], leave_one_out: bool = True) -> float:
+    """
+    Compute ROUGE-L F1 score for a candidate vs. positive references.
+    Returns the best ROUGE-L F1 across references.
+    """
+    return RougeEngine(refs_pos=positive_refs).contrastive(candidate, leave_one_out)["rouge_pos"]
 
 def compute_rouge_anchor(candidate: str,
                          bta_text: Optional[str] = None,
@@ -29,20 +143,7 @@ def compute_rouge_anchor(candidate: str,
     Compute ROUGE-L F1 against best-true and best-false anchors.
     Returns dict with rouge_bta, rouge_bfa, rouge_bta_minus_bfa.
     """
-    scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-
-    def _score_or_zero(cand, ref):
-        if not ref or not cand:
-            return 0.0
-        return scorer.score(cand, ref)['rougeL'].fmeasure
-
-    rouge_bta = _score_or_zero(candidate, bta_text)
-    rouge_bfa = _score_or_zero(candidate, bfa_text)
-    return {
-        "rouge_bta": rouge_bta,
-        "rouge_bfa": rouge_bfa,
-        "rouge_bta_minus_bfa": rouge_bta - rouge_bfa
-    }
+    return RougeEngine(bta_text=bta_text, bfa_text=bfa_text).anchor(candidate)
 
 
 def compute_rouge_contrastive(candidate: str,
@@ -51,19 +152,9 @@ def compute_rouge_contrastive(candidate: str,
                               leave_one_out: bool = True) -> dict:
     """
     Compute ROUGE-L F1 against positive references and contrast with negatives.
+    Use a RougeEngine per question to reuse reference tokens across candidates.
     """
-    rouge_pos = compute_rouge(candidate, refs_pos, leave_one_out)
-
-    rouge_neg_max = 0.0
-    if refs_neg:
-        scores = [compute_rouge(candidate, [neg], leave_one_out=False) for neg in refs_neg]
-        rouge_neg_max = max(scores) if scores else 0.0
-
-    return {
-        "rouge_pos": rouge_pos,
-        "rouge_neg_max": rouge_neg_max,
-        "rouge_contrast": rouge_pos - rouge_neg_max
-    }
+    return RougeEngine(refs_pos=refs_pos, refs_neg=refs_neg).contrastive(candidate, leave_one_out)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+# evaluation/sweep.py
+"""
+Grid search over GHI weights.
+
+RA, CC and LHC are computed once; every (alpha, gamma, delta) combination on
+the weight simplex is then scored and ranked against the hallucination label
+with a rank-based (Mann-Whitney) AUROC, a memory-bounded chunk at a time.
+"""
+from typing import Dict, Optional, Sequence
+import numpy as np
+import pandas as pd
+
+from .metric_calculation import combine_ghi, compute_metrics, compute_ra_columns, compute_cc_columns, compute_lhc_columns
+
+# Default weights of compute_ghi and compute_tuned_ghi, reported for reference
+REFERENCE_WEIGHTS = {
+    "GHI": (0.3, 0.5, 0.2),
+    "alt_GHI": (0.70, 0.15, 0.15),
+}
+
+
+def simplex_weight_grid(step: float = 0.01) -> np.ndarray:
+    """All (alpha, gamma, delta) >= 0 summing to 1 on a grid of `step`, shape (k, 3)."""
+    steps = int(round(1.0 / step))
+    i, j = np.meshgrid(np.arange(steps + 1), np.arange(steps + 1), indexing="ij")
+    keep = i + j <= steps
+    i, j = i[keep], j[keep]
+    return np.stack([i, j, steps - i - j], axis=1) / steps
+
+# Peak working memory per score cell: the float64 scores, the argsort indices
+# and sorted copy, one int32 rank buffer and a few boolean masks
+_BYTES_PER_CELL = 48
+DEFAULT_MEMORY_BUDGET = 256 * 2**20
+
+
+def _columns_per_chunk(n_rows: int, memory_budget: int) -> int:
+    """Score columns that fit in `memory_budget` bytes of working memory (at least one)."""
+    return max(1, memory_budget // (max(n_rows, 1) * _BYTES_PER_CELL))
+
+def _auroc_block(scores: np.ndarray, positive: np.ndarray, n_pos: int, n_neg: int) -> np.ndarray:
+    n = scores.shape[0]
+    order = np.argsort(scores, axis=0, kind="stable")
+    ranked = np.take_along_axis(scores, order, axis=0)
+    pos_sorted = positive[order]
+    del order
+
+    # starts/ends mark the first and last element of each run of equal scores
+    starts = np.empty(ranked.shape, dtype=bool)
+    starts[0] = True
+    np.not_equal(ranked[1:], ranked[:-1], out=starts[1:])
+    del ranked
+    ends = np.empty_like(starts)
+    ends[:-1] = starts[1:]
+    ends[-1] = True
+
+    # A tied run's average rank is (first + last) / 2 (1-based positions). The
+    # positives' first and last positions are summed one after the other in
+    # the same int32 buffer rather than kept side by side.
+    positions = np.arange(1, n + 1, dtype=np.int32 if n < 2**31 - 1 else np.int64)[:, None]
+    buf = np.zeros(scores.shape, dtype=positions.dtype)
+    np.copyto(buf, positions, where=starts)
+    np.maximum.accumulate(buf, axis=0, out=buf)
+    twice_rank_sum = (buf * pos_sorted).sum(axis=0, dtype=np.float64)
+
+    buf.fill(n + 1)
+    np.copyto(buf, positions, where=ends)
+    np.minimum.accumulate(buf[::-1], axis=0, out=buf[::-1])
+    twice_rank_sum += (buf * pos_sorted).sum(axis=0, dtype=np.float64)
+
+    return (twice_rank_sum / 2.0 - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg)
+
+def auroc_columns(scores: np.ndarray, positive: np.ndarray,
+                  memory_budget: int = DEFAULT_MEMORY_BUDGET) -> np.ndarray:
+    """
+    AUROC of every column of `scores` (n, k) for the boolean labels `positive` (n,).
+    Tied scores get their average rank, so ties count as half a correct ordering.
+    Columns are ranked in blocks sized to stay within `memory_budget` bytes.
+    """
+    positive = np.asarray(positive, dtype=bool)
+    n_pos = int(positive.sum())
+    n_neg = len(positive) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return np.full(scores.shape[1], np.nan)
+
+    chunk = _columns_per_chunk(scores.shape[0], memory_budget)
+    auroc = np.empty(scores.shape[1])
+    for start in range(0, scores.shape[1], chunk):
+        auroc[start:start + chunk] = _auroc_block(scores[:, start:start + chunk], positive, n_pos, n_neg)
+    return auroc
+
+def sweep_ghi_weights(data,
+                      hallucinated: Sequence[bool],
+                      step: float = 0.01,
+                      weights: Optional[np.ndarray] = None,
+                      memory_budget: int = DEFAULT_MEMORY_BUDGET) -> pd.DataFrame:
+    """
+    AUROC of GHI = alpha*RA + gamma*CC + delta*LHC for every weight combination.
+
+    :param data: DataFrame or dict of columns accepted by compute_metrics.
+    :param hallucinated: Positive class per row (e.g. not true_answer).
+    :param step: Grid spacing on the weight simplex, used when `weights` is None.
+    :param weights: Optional explicit (k, 3) array of (alpha, gamma, delta).
+    :param memory_budget: Approximate bytes of working memory; weight combinations
+        are scored in chunks of budget // (rows * bytes per score), so peak memory
+        stays flat as the row count grows.
+    :return: One row per combination with alpha, gamma, delta and auroc, best first.
+    """
+    ra, cc, lhc = (col[:, None] for col in (
+        compute_ra_columns(data), compute_cc_columns(data), compute_lhc_columns(data)
+    ))
+    weights = simplex_weight_grid(step) if weights is None else np.asarray(weights, dtype=float)
+    labels = np.asarray(hallucinated, dtype=bool)
+
+    # Scores come from combine_ghi, elementwise like compute_metrics, so a
+    # combination's AUROC does not depend on which chunk it falls in
+    chunk = _columns_per_chunk(len(labels), memory_budget)
+    auroc = np.empty(len(weights))
+    for start in range(0, len(weights), chunk):
+        block = weights[start:start + chunk]
+        scores = combine_ghi(ra, cc, lhc, block[:, 0], block[:, 1], block[:, 2])
+        auroc[start:start + len(block)] = auroc_columns(scores, labels, memory_budget)
+
+    out = pd.DataFrame({
+        "alpha": weights[:, 0],
+        "gamma": weights[:, 1],
+        "delta": weights[:, 2],
+        "auroc": auroc,
+    })
+    return out.sort_values("auroc", ascending=False, kind="stable").reset_index(drop=True)
+
+def reference_auroc(data, hallucinated: Sequence[bool]) -> Dict[str, float]:
+    """AUROC of the hard-coded GHI and alt_GHI scores, computed exactly as compute_metrics does."""
+    metrics = compute_metrics(data)
+    scores = np.column_stack([metrics[name] for name in REFERENCE_WEIGHTS])
+    auroc = auroc_columns(scores, np.asarray(hallucinated, dtype=bool))
+    return dict(zip(REFERENCE_WEIGHTS, auroc.tolist()))
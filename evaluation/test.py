@@ -0,0 +1,261 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation.lcs import lcs_length
+from evaluation.rouge import RougeEngine
+from evaluation.bleu import BleuEngine
+from evaluation.question_index import QuestionIndex
+from evaluation.sweep import auroc_columns, reference_auroc, simplex_weight_grid, sweep_ghi_weights
+from evaluation.generation import CompletionIndex, FakeBackend, iter_generations, run_generation
+from evaluation import llama
+from evaluation.llama import generate_answers
+from evaluation.metric_calculation import METRIC_INPUTS, compute_metrics, compute_ra, compute_cc, compute_lhc, compute_ghi, compute_tuned_ghi
+
+import ast
+import asyncio
+import math
+import random
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+import sacrebleu
+from rouge_score import rouge_scorer
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "clean", "truthful_qa_train.csv")
+
+# LCS / ROUGE-L Tests #
+
+def test_lcs_matches_dp_table():
+    rng = random.Random(0)
+    for _ in range(500):
+        vocab = rng.randint(1, 8)
+        a = [rng.randrange(vocab) for _ in range(rng.randint(0, 90))]
+        b = [rng.randrange(vocab) for _ in range(rng.randint(0, 90))]
+        expected = rouge_scorer._lcs_table(a, b)[-1][-1] if a and b else 0
+        assert lcs_length(a, b) == expected
+        assert lcs_length(b, a) == expected
+
+def test_rouge_engine_matches_rouge_score():
+    # Regression corpus: every answer of a question scored against every other one
+    df = pd.read_csv(DATA_PATH).head(40)
+    scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=True)
+    for _, row in df.iterrows():
+        answers = [a.strip() for a in ast.literal_eval(row["Correct Answers"]) + ast.literal_eval(row["Incorrect Answers"])]
+        answers += [row["Best Answer"], row["Question"], ""]
+        engine = RougeEngine(refs_pos=answers)
+        for cand in answers:
+            for ref in answers:
+                assert engine.fmeasure(cand, ref) == scorer.score(cand, ref)["rougeL"].fmeasure
+
+# BLEU Tests #
+
+def _sacrebleu(candidate, refs):
+    return float(sacrebleu.corpus_bleu([candidate], [[r] for r in refs]).score) if refs else 0.0
+
+def test_bleu_engine_matches_sacrebleu():
+    df = pd.read_csv(DATA_PATH).head(40)
+    for _, row in df.iterrows():
+        pos = [a.strip() for a in ast.literal_eval(row["Correct Answers"])]
+        neg = [a.strip() for a in ast.literal_eval(row["Incorrect Answers"])]
+        bta, bfa = row["Best Answer"].strip(), row["Best Incorrect Answer"].strip()
+        engine = BleuEngine(refs_pos=pos, refs_neg=neg, bta_text=bta, bfa_text=bfa)
+        for cand in pos + neg + [row["Question"], ""]:
+            scores = engine.score(cand, leave_one_out=True)
+            assert scores["bleu_pos"] == _sacrebleu(cand, [r for r in pos if r != cand])
+            assert scores["bleu_neg_max"] == max(_sacrebleu(cand, [n]) for n in neg)
+            assert scores["bleu_bta"] == _sacrebleu(cand, [bta])
+            assert scores["bleu_bfa"] == _sacrebleu(cand, [bfa])
+
+# Question Index Tests #
+
+def test_question_index_single_pass():
+    rows = [
+        {"qid": 1, "answer": "Paris", "true_answer": True, "best_true_answer": True},
+        {"qid": 1, "answer": " Paris ", "true_answer": True},
+        {"qid": 1, "answer": "Lyon", "true_answer": False, "best_false_answer": True},
+        {"qid": 1, "answer": "", "true_answer": False},
+        {"qid": 1, "answer": "It is Paris", "true_answer": True, "best_true_answer": True},
+    ]
+    index = QuestionIndex.from_rows(rows)
+    assert index.refs_pos == ["Paris", "It is Paris"]
+    assert index.refs_neg == ["Lyon"]
+    assert index.bta == "It is Paris" and index.bfa == "Lyon"  # last flag wins
+    assert index.answer_ids[0] == index.answer_ids[1]
+    assert index.text(index.answer_ids[3]) == ""
+
+    # Engines built on the index score like engines built from the texts
+    bleu = BleuEngine(refs_pos=index.refs_pos, refs_neg=index.refs_neg, bta_text=index.bta, bfa_text=index.bfa)
+    rouge = RougeEngine(refs_pos=index.refs_pos, refs_neg=index.refs_neg, bta_text=index.bta, bfa_text=index.bfa)
+    for answer_id in index.answer_ids:
+        text = index.text(answer_id)
+        assert BleuEngine(index=index).score_id(answer_id) == bleu.score(text)
+        assert RougeEngine(index=index).score_id(answer_id) == rouge.score(text)
+
+# Metric Tests #
+
+def test_compute_metrics_matches_row_functions():
+    rng = random.Random(0)
+    odd_values = [None, math.nan, math.inf, -math.inf, "abc", "0.25", "", True, -0.0]
+    rows = []
+    for _ in range(2000):
+        row = {}
+        for key in METRIC_INPUTS:
+            r = rng.random()
+            if r < 0.1:
+                continue  # missing key
+            row[key] = rng.choice(odd_values) if r < 0.4 else rng.uniform(-0.5, 1.5) * rng.choice([1, 100])
+        rows.append(row)
+
+    columns = compute_metrics({key: [row.get(key) for row in rows] for key in METRIC_INPUTS})
+    for name, fn in [("RA", compute_ra), ("CC", compute_cc), ("LHC", compute_lhc), ("GHI", compute_ghi), ("alt_GHI", compute_tuned_ghi)]:
+        assert [fn(row) for row in rows] == columns[name].tolist()
+
+    # A float DataFrame gives the same values as its records
+    df = pd.DataFrame([{k: v for k, v in row.items() if isinstance(v, float)} for row in rows])
+    columns = compute_metrics(df)
+    assert [compute_ghi(row) for row in df.to_dict("records")] == columns["GHI"].tolist()
+
+def test_auroc_columns_matches_pairwise_count():
+    rng = np.random.default_rng(0)
+    scores = np.round(rng.random((200, 20)), 1)  # rounding forces ties
+    positive = rng.random(200) < 0.3
+    expected = [
+        (scores[positive, k][:, None] > scores[~positive, k][None, :]).mean()
+        + 0.5 * (scores[positive, k][:, None] == scores[~positive, k][None, :]).mean()
+        for k in range(scores.shape[1])
+    ]
+    assert np.allclose(auroc_columns(scores, positive), expected)
+
+    grid = simplex_weight_grid(0.1)
+    assert len(grid) == 66 and np.allclose(grid.sum(axis=1), 1.0)
+
+    # Ranking a column at a time gives the same AUROCs
+    assert np.array_equal(auroc_columns(scores, positive, memory_budget=1), auroc_columns(scores, positive))
+
+def test_sweep_ghi_weights_independent_of_memory_budget():
+    rng = np.random.default_rng(1)
+    data = {key: np.round(rng.random(500), 2) for key in METRIC_INPUTS}
+    hallucinated = rng.random(500) < 0.4
+
+    results = sweep_ghi_weights(data, hallucinated, step=0.05)
+    pd.testing.assert_frame_equal(results, sweep_ghi_weights(data, hallucinated, step=0.05, memory_budget=1))
+
+    # The default weights score exactly as compute_metrics' GHI / alt_GHI do
+    weights = np.array([(0.3, 0.5, 0.2), (0.70, 0.15, 0.15)])
+    defaults = sweep_ghi_weights(data, hallucinated, weights=weights).set_index("alpha")["auroc"]
+    reference = reference_auroc(data, hallucinated)
+    assert defaults[0.3] == reference["GHI"] and defaults[0.70] == reference["alt_GHI"]
+
+
+# Generation Tests #
+
+def test_run_generation_with_fake_backend():
+    jobs = [(qid, f"Question {qid}?", temp) for qid in range(20) for temp in (0.1, 0.7)]
+    backend = FakeBackend(latency=0.01, failures=3)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, "generations.csv")
+        written = asyncio.run(run_generation(jobs, backend, out_path, concurrency=4, base_delay=0.001))
+        df = pd.read_csv(out_path)
+
+    assert written == len(jobs) == len(df)
+    assert sorted(zip(df["QID"], df["Temperature"])) == sorted((q, t) for q, _, t in jobs)
+    assert not df["Answer"].str.startswith("API_ERROR").any()  # failures were retried
+    assert backend.calls == len(jobs) + 3
+    assert backend.max_in_flight <= 4
+
+def test_completion_index_resume():
+    jobs = [(qid, f"Question {qid}?", temp) for qid in range(10) for temp in (0.1, 1.3)]
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, "generations.csv")
+        index = CompletionIndex(out_path + ".done")
+        asyncio.run(run_generation(jobs[:7], FakeBackend(), out_path, index=index))
+        index.close()
+        with open(index.path, "a", encoding="utf-8") as f:
+            f.write("9\t0.1")  # torn line from a crash
+
+        index = CompletionIndex(out_path + ".done")
+        assert len(index) == 7
+        todo = [j for j in jobs if not index.is_done(j[0], j[2], "fake")]
+        assert todo == jobs[7:]
+        assert not index.is_done(0, 0.1, "other-model")
+        asyncio.run(run_generation(todo, FakeBackend(), out_path, index=index))
+        index.close()
+        assert len(CompletionIndex(index.path)) == len(jobs)
+        assert len(pd.read_csv(out_path)) == len(jobs)
+
+        # Results written before the sidecar existed: index them once from the CSV
+        os.remove(index.path)
+        rebuilt = CompletionIndex.from_results_csv(out_path, "fake")
+        assert len(rebuilt) == len(jobs) and os.path.exists(out_path + ".done")
+
+def test_llama_main_ignores_sidecar_of_deleted_results():
+    data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "clean", "truthful_qa_train.csv")
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in ("csv", "jsonl"):
+            out_path = os.path.join(tmp, f"results.{fmt}")
+            run = lambda: llama.main(data_path, out_path, preview_n=3, temperatures=[0.1, 1.0],
+                                     fake=True, rate=None, output_format=fmt)
+            run()
+            with open(out_path, "rb") as f:
+                first = f.read()
+
+            # Results deleted (or emptied) but the sidecar left behind: every job runs again
+            os.remove(out_path)
+            run()
+            with open(out_path, "rb") as f:
+                assert f.read() == first
+            open(out_path, "w").close()
+            run()
+            with open(out_path, "rb") as f:
+                assert f.read() == first
+            assert len(CompletionIndex(out_path + ".done")) == 6
+
+def test_generate_answers_streams_and_skips_completed():
+    questions = [(qid, f"Question {qid}?") for qid in range(5)]
+    with tempfile.TemporaryDirectory() as tmp:
+        completed = CompletionIndex(os.path.join(tmp, "results.csv.done"))
+        completed.mark_done(0, 0.1, "fake")
+        rows = list(generate_answers(questions, [0.1, 1.0], backend=FakeBackend(latency=0.01), completed=completed, rate=None))
+        completed.close()
+    assert sorted((r["QID"], r["Temperature"]) for r in rows) == [(q, t) for q, _ in questions for t in (0.1, 1.0)][1:]
+    assert all(r["Answer"].startswith("Answer to 'Question") for r in rows)
+
+def test_iter_generations_close_cancels_requests():
+    backend = FakeBackend(latency=0.02)
+    jobs = [(qid, f"Question {qid}?", 0.7) for qid in range(200)]
+    rows = iter_generations(jobs, backend, concurrency=2)
+    first = [next(rows) for _ in range(3)]
+    rows.close()
+    calls = backend.calls
+    time.sleep(0.2)
+    assert len(first) == 3
+    assert calls < 20 and backend.calls == calls
+    assert backend.in_flight == 0
+    assert not any(t.name == "generation" for t in threading.enumerate())
+
+if __name__ == "__main__":
+    tests = [
+        ("test_lcs_matches_dp_table", test_lcs_matches_dp_table),
+        ("test_rouge_engine_matches_rouge_score", test_rouge_engine_matches_rouge_score),
+        ("test_bleu_engine_matches_sacrebleu", test_bleu_engine_matches_sacrebleu),
+        ("test_question_index_single_pass", test_question_index_single_pass),
+        ("test_compute_metrics_matches_row_functions", test_compute_metrics_matches_row_functions),
+        ("test_auroc_columns_matches_pairwise_count", test_auroc_columns_matches_pairwise_count),
+        ("test_sweep_ghi_weights_independent_of_memory_budget", test_sweep_ghi_weights_independent_of_memory_budget),
+        ("test_run_generation_with_fake_backend", test_run_generation_with_fake_backend),
+        ("test_completion_index_resume", test_completion_index_resume),
+        ("test_llama_main_ignores_sidecar_of_deleted_results", test_llama_main_ignores_sidecar_of_deleted_results),
+        ("test_generate_answers_streams_and_skips_completed", test_generate_answers_streams_and_skips_completed),
+        ("test_iter_generations_close_cancels_requests", test_iter_generations_close_cancels_requests),
+    ]
+
+    for name, func in tests:
+        try:
+            func()
+            print(f"{name}: PASSED")
+        except Exception as e:
+            print(f"{name}: FAILED - {e}")
+    print("All tests passed!")
@@ -1,25 +1,25 @@
 # __init__.py
-from .readability import compute_readability
+from .readability import compute_readability, ParsedDocument, parse_document
 from .lexical import compute_lexical_features
 from .style import compute_style_features
 from .entities import compute_entities_features
 
 class _Readability:
     name = "readability"
-    def compute(self, text): return compute_readability(text)
+    def compute(self, doc): return compute_readability(doc)
 
 class _Lexical:
     name = "lexical"
-    def compute(self, text): return compute_lexical_features(text)
+    def compute(self, doc): return compute_lexical_features(doc)
 
 class _Style:
     name = "style"
-    def compute(self, text): 
+    def compute(self, doc): 
         # default to lemma for robust matching; override per-call if needed
-        return compute_style_features(text, norm="lemma")
+        return compute_style_features(doc, norm="lemma")
 
 class _Entities:
     name = "entities"
-    def compute(self, text): return compute_entities_features(text)
+    def compute(self, doc): return compute_entities_features(doc)
 
 ALL_EXTRACTORS = [_Readability(), _Lexical(), _Style(), _Entities()]
\ No newline at end of file
@@ -1,9 +1,9 @@
 # aggregate_features.py
-from typing import Dict, Iterable, Optional, List, Any
+from typing import Dict, Iterable, Optional, List, Any, Tuple
 from statistics import mean, stdev
 import math
-from . import ALL_EXTRACTORS
-from .nli_scoring import score_nli, score_answer_vs_bta
+from . import ALL_EXTRACTORS, ParsedDocument
+from .nli_scoring import score_nli_batch, DEFAULT_BATCH_SIZE
 
 def compute_features(
     text: str,
@@ -20,9 +20,11 @@ def compute_features(
         ext for ext in ALL_EXTRACTORS if ext.name in use
     ]
     
+    # Sentence-split and tokenize once; every extractor reads the same document
+    doc = ParsedDocument(text)
     out: Dict[str, float] = {}
     for ext in selected:
-        features = ext.compute(text)
+        features = ext.compute(doc)
         out.update(features)
     return out
 
@@ -47,23 +49,69 @@ def aggregate_scores(scores: List[Dict[str, float]], labels=("ENTAILMENT", "NEUT
     return agg
 
 
-def process_answer(qid: int,
+class QuestionNLI:
+    """
+    Directed NLI scores for every answer of one question, computed in a single batch.
+
+    Identical answer strings are scored once: the N x N answer:answer matrix is
+    built over the unique texts (both directions, since NLI is not symmetric),
+    together with question:answer and BTA:answer for each unique text.
+    """
+    def __init__(
+        self,
+        question: str,
+        answers: List[str],
+        bta_text: Optional[str] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        self.question = question
+        self.bta_text = bta_text
+        self.texts = list(dict.fromkeys(answers))
+
+        pairs: Dict[Tuple[str, str], int] = {}
+        for text in self.texts:
+            pairs.setdefault((question, text), len(pairs))
+            if bta_text:
+                pairs.setdefault((bta_text, text), len(pairs))
+            for other in self.texts:
+                if other.strip() != text.strip():
+                    pairs.setdefault((text, other), len(pairs))
+
+        self.pair_count = len(pairs)
+        scored = score_nli_batch(list(pairs), batch_size=batch_size)
+        self._scores = {pair: scored[i] for pair, i in pairs.items()}
+
+    def question_scores(self, answer: str) -> Dict[str, float]:
+        return self._scores[(self.question, answer)]
+
+    def bta_scores(self, answer: str) -> Optional[Dict[str, float]]:
+        if not self.bta_text:
+            return None
+        return self._scores[(self.bta_text, answer)]
+
+    def pair_scores(self, answer: str, all_answers: List[str]) -> List[Dict[str, float]]:
+        """NLI scores of answer vs. every other answer (duplicates kept, self-matches skipped)."""
+        return [
+            self._scores[(answer, other)]
+            for other in all_answers
+            if other.strip() != answer.strip()
+        ]
+
+
+def _build_row(
+    qid: int,
     question: str,
     answer: str,
     all_answers: List[str],
-    *,
     is_true: bool,
     is_best: bool,
-    bta_text: Optional[str] = None,
+    q_scores: Dict[str, float],
+    pair_scores: List[Dict[str, float]],
+    bta_scores: Optional[Dict[str, float]],
+    feats: Optional[Dict[str, float]] = None,
 ) -> Dict[str, Any]:
-
-    """
-    Compute features for a single answer including:
-      - text-based features
-      - NLI with the question
-      - Aggregated NLI scores vs. all other answers for this question
-    """
-    feats = compute_features(answer)
+    if feats is None:
+        feats = compute_features(answer)
     
     row = {
         "qid": qid,
@@ -86,20 +134,11 @@ def process_answer(qid: int,
         row[k] = v
 
     # NLI question:answer
-    for label, score in score_nli(question, answer).items():
+    for label, score in q_scores.items():
         row[f"nli_q_{label.lower()}"] = score
 
-    # NLI answer:answer (all other answers)
-    pair_scores = []
-    for other in all_answers:
-        if other.strip() == answer.strip():
-            continue
-        pair_scores.append(score_nli(answer, other))
-    
     # NLI answer:BTA (answer against BTA if available)
-    if bta_text: 
-        bta_scores = score_answer_vs_bta(bta_text, answer)
-        
+    if bta_scores is not None:
         for label, prob in bta_scores.items():
             key = label.strip().lower()
             if key == "entailment":
@@ -109,8 +148,82 @@ def process_answer(qid: int,
             elif key == "contradiction":
                 row["nli_contradiction_vs_best_true"] = float(prob)
 
-    # aggregate pairwise results
+    # aggregate pairwise results (answer:answer vs. all other answers)
     agg = aggregate_scores(pair_scores)
     row.update(agg)
 
-    return row
\ No newline at end of file
+    return row
+
+
+def process_answer(qid: int,
+    question: str,
+    answer: str,
+    all_answers: List[str],
+    *,
+    is_true: bool,
+    is_best: bool,
+    bta_text: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Dict[str, Any]:
+
+    """
+    Compute features for a single answer including:
+      - text-based features
+      - NLI with the question
+      - Aggregated NLI scores vs. all other answers for this question
+
+    Use process_question when scoring every answer of a question.
+    """
+    # Collect every NLI pair for this answer so they run as one batch:
+    # question:answer, answer:answer (all other answers), BTA:answer
+    others = [other for other in all_answers if other.strip() != answer.strip()]
+    pairs = [(question, answer)] + [(answer, other) for other in others]
+    if bta_text:
+        pairs.append((bta_text, answer))
+    scored = score_nli_batch(pairs, batch_size=batch_size)
+
+    return _build_row(
+        qid, question, answer, all_answers, is_true, is_best,
+        q_scores=scored[0],
+        pair_scores=scored[1:1 + len(others)],
+        bta_scores=scored[-1] if bta_text else None,
+    )
+
+
+def process_question(qid: int,
+    question: str,
+    true_answers: List[str],
+    false_answers: List[str],
+    *,
+    best_true_text: Optional[str] = None,
+    best_false_text: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    text_features: Optional[Dict[str, Dict[str, float]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Compute feature rows for every answer of a question.
+
+    The question's NLI pairs are scored once through QuestionNLI and each
+    answer's nli_q_*, nli_*_vs_best_true and nli_pair_* columns are read from
+    it, so rows match calling process_answer for each answer.
+
+    :param text_features: Optional precomputed compute_features output keyed by
+        answer text (e.g. from a worker process); computed here when omitted.
+    """
+    all_answers = true_answers + false_answers
+    if text_features is None:
+        text_features = {ans: compute_features(ans) for ans in dict.fromkeys(all_answers)}
+    nli = QuestionNLI(question, all_answers, bta_text=best_true_text, batch_size=batch_size)
+
+    rows = []
+    for ans in all_answers:
+        is_true = ans in true_answers
+        is_best = (ans == best_true_text) if is_true else (ans == best_false_text)
+        rows.append(_build_row(
+            qid, question, ans, all_answers, is_true, is_best,
+            q_scores=nli.question_scores(ans),
+            pair_scores=nli.pair_scores(ans, all_answers),
+            bta_scores=nli.bta_scores(ans),
+            feats=dict(text_features[ans]),
+        ))
+    return rows
@@ -0,0 +1,244 @@
+# batch.py
+"""
+Columnar feature extraction: compute_features over a whole column of answers.
+
+A batch of texts is split and tokenized once with vectorized string ops;
+tokens are then factorized to integer ids, so per-row counts are NumPy
+bincounts/sorts and lexicon/normalization lookups happen once per distinct
+token rather than once per occurrence. textstat and the geo trie have no
+vectorized form and run in plain loops (textstat once per distinct text).
+Values match the scalar extractors in `features/` within float tolerance;
+benchmarks/bench_stages.py fails if this is slower than compute_features.
+"""
+
+import re
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .readability import WORD_RE, TERMINATORS, LINE_BREAKS, _textstat
+from .lexical import STOPWORDS
+from .style import normalized_lexicons, normalize_token
+from .entities import NUMBER_PATTERN, YEAR_PATTERN, CURRENCY_PATTERN, get_geo_matcher
+
+SENTENCE_SPLIT = "[" + re.escape("".join(TERMINATORS)) + "]"
+
+
+class _Batch:
+    """Sentence and token views of a column of texts, shared by every batch extractor."""
+    def __init__(self, texts: pd.Series):
+        self.index = texts.index
+        self.n = len(texts)
+        rows = pd.RangeIndex(self.n)
+
+        # object dtype keeps Python str semantics (lower/strip) identical to the scalar path
+        text = texts.fillna("").astype(str).astype(object).str.strip()
+        text.index = rows
+        self.text = text
+
+        split_src = text
+        for br in LINE_BREAKS:
+            split_src = split_src.str.replace(br, " ", regex=False)
+        sentences = split_src.str.strip().str.split(SENTENCE_SPLIT, regex=True).explode().astype(object).str.strip()
+        # index: row number, one entry per non-empty sentence
+        self.sentences = sentences[sentences.fillna("") != ""]
+
+        self.sentence_tokens = self.sentences.str.lower().str.findall(WORD_RE)
+        self.sentence_lengths = self.sentence_tokens.str.len().astype(float)
+
+        # One entry per lowercased token, in text order: its row number and its id
+        # in `vocab`. Per-row counts are bincounts over these integer arrays.
+        tokens = self.sentence_tokens.explode().dropna()
+        self.token_rows = tokens.index.to_numpy(dtype=np.int64)
+        codes, vocab = pd.factorize(tokens.to_numpy(dtype=object))
+        self.token_codes = codes.astype(np.int64)
+        self.vocab = np.asarray(vocab, dtype=object)
+        self.token_count = pd.Series(np.bincount(self.token_rows, minlength=self.n).astype(float))
+
+        # the same tokens as one plain list per row, for extractors that walk them in Python
+        self.row_tokens: List[List[str]] = [[] for _ in range(self.n)]
+        for row, tokens in zip(self.sentence_tokens.index, self.sentence_tokens):
+            self.row_tokens[row].extend(tokens)
+
+    def row_sum(self, token_values: np.ndarray) -> pd.Series:
+        """Per-row sum of a value given for every token."""
+        return pd.Series(np.bincount(self.token_rows, weights=token_values, minlength=self.n))
+
+    def vocab_flags(self, words) -> np.ndarray:
+        """Per-token flag: is the token (via its vocab entry) in `words`."""
+        return np.fromiter((t in words for t in self.vocab), dtype=bool, count=len(self.vocab))[self.token_codes]
+
+    def _row_keyed(self, keys: np.ndarray, rows: np.ndarray):
+        # (row, key) pairs as one sorted int64 per pair, a mask of the first of
+        # each run of equal pairs, and the stride to recover the row
+        width = int(keys.max()) + 1 if len(keys) else 1
+        combined = np.sort(rows * width + keys)
+        first = np.empty(len(combined), dtype=bool)
+        first[:1] = True
+        np.not_equal(combined[1:], combined[:-1], out=first[1:])
+        return combined, first, width
+
+    def row_distinct(self, keys: np.ndarray, rows: np.ndarray) -> pd.Series:
+        """Number of distinct `keys` per row (keys are non-negative ints, one per entry of `rows`)."""
+        combined, first, width = self._row_keyed(keys, rows)
+        return pd.Series(np.bincount(combined[first] // width, minlength=self.n).astype(float))
+
+    def row_max_count(self, keys: np.ndarray, rows: np.ndarray) -> pd.Series:
+        """Occurrences of the most frequent key in each row."""
+        combined, first, width = self._row_keyed(keys, rows)
+        starts = np.flatnonzero(first)
+        counts = np.diff(np.append(starts, len(combined)))
+        out = np.zeros(self.n)
+        np.maximum.at(out, combined[starts] // width, counts)
+        return pd.Series(out)
+
+    def _per_row(self, values: pd.Series, fill: float = 0.0) -> pd.Series:
+        return values.reindex(pd.RangeIndex(self.n), fill_value=fill).astype(float)
+
+    def has_tokens(self) -> pd.Series:
+        return self.token_count > 0
+
+
+def _readability(b: _Batch) -> pd.DataFrame:
+    # textstat has no vectorized API; score each distinct text once, both scores
+    # back to back so the second reuses textstat's per-text caches (word/syllable/sentence counts)
+    textstat = _textstat()
+    fe_map, fk_map = {}, {}
+    for t in pd.unique(b.text):
+        fe_map[t] = float(textstat.flesch_reading_ease(t)) if t else 0.0  # type: ignore
+        fk_map[t] = float(textstat.flesch_kincaid_grade(t)) if t else 0.0  # type: ignore
+
+    sentence_count = b._per_row(b.sentences.groupby(level=0).size())
+    token_count = b._per_row(b.sentence_lengths.groupby(level=0).sum())
+    safe_count = sentence_count.where(sentence_count > 0, 1.0)
+    mean_len = token_count / safe_count
+
+    dev = b.sentence_lengths - mean_len.reindex(b.sentence_lengths.index).to_numpy()
+    var = b._per_row((dev ** 2).groupby(level=0).sum()) / safe_count
+
+    return pd.DataFrame({
+        "reading_ease": b.text.map(fe_map),
+        "fk_grade": b.text.map(fk_map),
+        "sentence_count": sentence_count,
+        "token_count": token_count,
+        "avg_sentence_len": mean_len,
+        "sentence_len_std": np.sqrt(var),
+    })
+
+
+def _lexical(b: _Batch) -> pd.DataFrame:
+    total = b.token_count
+    safe_total = total.where(total > 0, 1.0)
+    rows, codes = b.token_rows, b.token_codes
+
+    unique_count = b.row_distinct(codes, rows)
+    content = b.row_sum(~b.vocab_flags(STOPWORDS))
+    most_common = b.row_max_count(codes, rows)
+
+    # bigrams never cross rows: pair each token with the next one in the same row
+    same_row = rows[:-1] == rows[1:]
+    bigram_ids = pd.factorize(codes[:-1][same_row] * len(b.vocab) + codes[1:][same_row])[0]
+    unique_bigrams = b.row_distinct(bigram_ids.astype(np.int64), rows[:-1][same_row])
+    bigram_total = (total - 1).where(total > 1, 1.0)
+
+    return pd.DataFrame({
+        "unique_token_count": unique_count,
+        "type_token_ratio": unique_count / safe_total,
+        "lexical_density": content / safe_total,
+        "repetition_ratio": most_common / safe_total,
+        "unique_bigram_ratio": (unique_bigrams / bigram_total).where(total > 1, 0.0),
+    })
+
+
+def _style(b: _Batch, norm: str = "lemma") -> pd.DataFrame:
+    total = b.token_count
+    safe_total = total.where(total > 0, 1.0)
+
+    # normalize each distinct token once; lexicon membership is then looked up by token id
+    normalized = [normalize_token(t, method=norm) for t in b.vocab]
+
+    def _count(lexicon) -> pd.Series:
+        in_lexicon = np.fromiter((t in lexicon for t in normalized), dtype=bool, count=len(normalized))
+        return b.row_sum(in_lexicon[b.token_codes])
+
+    negators_norm, hedges_norm, boosters_norm = normalized_lexicons(norm)
+    neg_count = _count(negators_norm)
+    hedge_count = _count(hedges_norm)
+    booster_count = _count(boosters_norm)
+
+    out = pd.DataFrame({
+        "negation_count": neg_count,
+        "negation_ratio": neg_count / safe_total,
+        "hedge_ratio": hedge_count / safe_total,
+        "booster_ratio": booster_count / safe_total,
+        "modality_balance_simple": booster_count / (hedge_count + 1),
+        "modality_balance_log": np.log1p(booster_count) - np.log1p(hedge_count + 1e-6),
+    })
+
+    # Mirror the scalar schema: empty answers only carry `modality_balance`
+    empty = ~b.has_tokens()
+    out.loc[empty, ["modality_balance_simple", "modality_balance_log"]] = np.nan
+    if empty.any():
+        out["modality_balance"] = pd.Series(np.nan, index=out.index).where(~empty, 0.0)
+        if empty.all():
+            out = out.drop(columns=["modality_balance_simple", "modality_balance_log"])
+    return out
+
+
+def _entities(b: _Batch) -> pd.DataFrame:
+    total = b.token_count
+    has_tokens = b.has_tokens()
+
+    num_count = b.text.str.count(NUMBER_PATTERN).astype(float)
+    year_count = b.text.str.count(YEAR_PATTERN).astype(float)
+    currency_count = b.text.str.count(CURRENCY_PATTERN).astype(float)
+
+    # The trie walk and the per-sentence capitalization check are plain loops:
+    # exploding and regrouping the tokens in pandas costs more than the work itself
+    matcher = get_geo_matcher()
+    geo_count = pd.Series([float(matcher.count(tokens)) for tokens in b.row_tokens])
+
+    # Capitalized tokens, skipping the first token of each sentence
+    cap = np.zeros(b.n)
+    for row, sentence in zip(b.sentences.index, b.sentences):
+        cap[row] += sum(1 for tok in WORD_RE.findall(sentence)[1:] if tok[:1].isupper())
+    cap_count = pd.Series(cap)
+
+    counts = pd.DataFrame({
+        "entity_number_count": num_count,
+        "entity_year_count": year_count,
+        "entity_currency_count": currency_count,
+        "entity_geo_count": geo_count,
+        "entity_capitalized_count": cap_count,
+    })
+    counts["entity_ratio"] = counts.sum(axis=1) / total.where(has_tokens, 1.0)
+    return counts.mul(has_tokens.astype(float), axis=0)
+
+
+BATCH_EXTRACTORS = {
+    "readability": _readability,
+    "lexical": _lexical,
+    "style": _style,
+    "entities": _entities,
+}
+
+
+def compute_features_batch(
+    texts: Iterable[str],
+    use: Optional[Iterable[str]] = None
+) -> pd.DataFrame:
+    """
+    Compute all features for a column of texts at once.
+
+    :param texts: Answers to analyze (list, array or Series; a Series keeps its index).
+    :param use: Optional list of feature extractor names to use. If None, all extractors are used.
+    :return: One row per text with the same columns as compute_features.
+    """
+    series = texts if isinstance(texts, pd.Series) else pd.Series(list(texts), dtype=object)
+    names = list(BATCH_EXTRACTORS) if not use else [name for name in BATCH_EXTRACTORS if name in use]
+
+    b = _Batch(series)
+    out = pd.concat([BATCH_EXTRACTORS[name](b) for name in names], axis=1)
+    out.index = series.index
+    return out
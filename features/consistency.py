@@ -0,0 +1,132 @@
+# consistency.py
+"""
+Consistency features across several sampled answers to one question.
+
+All samples of a qid are handled together: every unique text is tokenized
+once and every ordered pair of unique texts is NLI-scored in one batch (the
+NLI cache also shares them with QuestionNLI's answer:answer pairs). Samples
+are then grouped into semantic clusters by bidirectional entailment, and the
+group gets the entropy of its cluster distribution plus lexical diversity
+measures. Each sample row carries the group features and its own cluster.
+"""
+import math
+from itertools import combinations
+from statistics import mean
+from typing import Any, Dict, List, Sequence, Tuple
+
+from .nli_scoring import DEFAULT_BATCH_SIZE, score_nli_batch
+from .readability import clean_and_tokenize
+
+
+def _entails(scores: Dict[str, float]) -> bool:
+    return max(scores, key=scores.get) == "ENTAILMENT"
+
+
+def semantic_clusters(texts: Sequence[str], nli: Dict[Tuple[str, str], Dict[str, float]]) -> List[int]:
+    """
+    Cluster id per text. A text joins the first cluster whose first member it
+    entails and is entailed by; identical texts always share a cluster.
+    """
+    labels: List[int] = []
+    representatives: List[str] = []
+    for text in texts:
+        for cluster, rep in enumerate(representatives):
+            if text == rep or (_entails(nli[(text, rep)]) and _entails(nli[(rep, text)])):
+                labels.append(cluster)
+                break
+        else:
+            labels.append(len(representatives))
+            representatives.append(text)
+    return labels
+
+
+def cluster_entropy(labels: Sequence[int]) -> float:
+    """Entropy (nats) of the cluster sizes, i.e. discrete semantic entropy."""
+    n = len(labels)
+    if n == 0:
+        return 0.0
+    counts: Dict[int, int] = {}
+    for label in labels:
+        counts[label] = counts.get(label, 0) + 1
+    return sum(c / n * math.log(n / c) for c in counts.values())
+
+
+def _ngrams(tokens: List[str], n: int) -> List[Tuple[str, ...]]:
+    return [tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+
+
+def lexical_diversity(token_lists: Sequence[List[str]]) -> Dict[str, float]:
+    """
+    distinct-1/2 over all samples (unique n-grams / total n-grams) and the mean
+    pairwise Jaccard distance between the samples' token sets.
+    """
+    out: Dict[str, float] = {}
+    for n in (1, 2):
+        grams = [g for tokens in token_lists for g in _ngrams(tokens, n)]
+        out[f"sample_distinct_{n}"] = len(set(grams)) / len(grams) if grams else 0.0
+
+    sets = [set(tokens) for tokens in token_lists]
+    distances = [
+        1.0 - len(a & b) / len(a | b) if a | b else 0.0
+        for a, b in combinations(sets, 2)
+    ]
+    out["sample_jaccard_distance_mean"] = mean(distances) if distances else 0.0
+    return out
+
+
+def consistency_features(samples: Sequence[str], batch_size: int = DEFAULT_BATCH_SIZE) -> Tuple[Dict[str, float], List[int]]:
+    """
+    Group-level consistency features for the sampled answers of one question,
+    and the cluster id of each sample.
+    """
+    samples = [str(s).strip() for s in samples]
+    texts = list(dict.fromkeys(samples))
+
+    pairs = [(a, b) for a in texts for b in texts if a != b]
+    nli = dict(zip(pairs, score_nli_batch(pairs, batch_size=batch_size)))
+    tokens = {text: clean_and_tokenize(text) for text in texts}
+
+    text_cluster = dict(zip(texts, semantic_clusters(texts, nli)))
+    labels = [text_cluster[s] for s in samples]
+    n_clusters = len(set(labels))
+    entropy = cluster_entropy(labels)
+
+    feats: Dict[str, float] = {
+        "sample_count": float(len(samples)),
+        "sample_unique_count": float(len(texts)),
+        "semantic_cluster_count": float(n_clusters),
+        "semantic_entropy": entropy,
+        # entropy / log(N): 0 when all samples agree, 1 when every sample is its own cluster
+        "semantic_entropy_norm": entropy / math.log(len(samples)) if len(samples) > 1 else 0.0,
+    }
+    for label in ("ENTAILMENT", "CONTRADICTION"):
+        vals = [scores[label] for scores in nli.values()]
+        feats[f"sample_nli_{label.lower()}_mean"] = mean(vals) if vals else 0.0
+    feats.update(lexical_diversity([tokens[s] for s in samples]))
+    return feats, labels
+
+
+def process_samples(qid: Any,
+    question: str,
+    samples: Sequence[Dict[str, Any]],
+    *,
+    answer_key: str = "answer",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> List[Dict[str, Any]]:
+    """
+    One row per sample of a question: the sample's own fields, its semantic
+    cluster and the share of samples in that cluster, plus the group features.
+    """
+    if not samples:
+        return []
+    group, labels = consistency_features([s[answer_key] for s in samples], batch_size=batch_size)
+
+    rows = []
+    for sample, label in zip(samples, labels):
+        row: Dict[str, Any] = {"qid": qid, "question": question}
+        row.update(sample)
+        row["semantic_cluster"] = label
+        row["semantic_cluster_share"] = labels.count(label) / len(labels)
+        row.update(group)
+        rows.append(row)
+    return rows
@@ -1,7 +1,7 @@
 import re
-import pycountry
-from typing import Dict
-from .readability import split_sentences_as_dict, clean_and_tokenize
+import weakref
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from .readability import ParsedDocument, parse_document
 
 
 # --- Regex patterns ---
@@ -29,32 +29,147 @@ us_states = [
     "wisconsin", "wyoming"
 ]
 
-country_names = [country.name.lower() for country in pycountry.countries] # type: ignore
-geo_terms = set(regions + country_names + us_states)
-
-def count_geo_terms(tokens: list[str], geo_terms: set[str]) -> int:
-    used = set()
-    count = 0
-    for n in (3, 2, 1):  # check trigrams, bigrams, unigrams in that order
-        i = 0
-        while i <= len(tokens) - n:
-            span_idx = tuple(range(i, i+n))
-            if any(j in used for j in span_idx):
-                i += 1
+# pycountry names and the matcher are built on first use (see get_geo_matcher);
+# `country_names`, `geo_terms` and `GEO_MATCHER` stay available as module attributes
+_geo_terms: Optional[set[str]] = None
+_geo_matcher: Optional["GeoTermMatcher"] = None
+
+def _country_names() -> list[str]:
+    import pycountry
+    return [country.name.lower() for country in pycountry.countries] # type: ignore
+
+def get_geo_terms() -> set[str]:
+    global _geo_terms
+    if _geo_terms is None:
+        _geo_terms = set(regions + _country_names() + us_states)
+    return _geo_terms
+
+class GeoTermMatcher:
+    """
+    Token-level trie over (possibly multi-word) gazetteer terms.
+
+    Matching walks the tokens once, left to right, and collects every term
+    occurrence; overlapping occurrences are then resolved longest-first and
+    left-to-right within a length. Per-answer cost depends on the answer
+    length and max_len, not on how many terms the gazetteer holds.
+    """
+    _END = None  # trie key marking the end of a term (tokens are never None)
+
+    def __init__(self, terms: Iterable[str] = (), max_len: int = 3):
+        self.max_len = max_len
+        self._root: dict = {}
+        self.size = 0
+        self.add_terms(terms)
+
+    def add_terms(self, terms: Iterable[str]) -> None:
+        for term in terms:
+            words = term.split(" ")
+            if len(words) > self.max_len:
+                continue
+            node = self._root
+            for word in words:
+                node = node.setdefault(word, {})
+            if self._END not in node:
+                node[self._END] = True
+                self.size += 1
+
+    def find(self, tokens: List[str]) -> List[Tuple[int, int]]:
+        """All (start, length) occurrences of gazetteer terms in tokens."""
+        root, end = self._root, self._END
+        found = []
+        n_tokens = len(tokens)
+        for i in range(n_tokens):
+            node = root
+            for j in range(i, min(n_tokens, i + self.max_len)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if end in node:
+                    found.append((i, j - i + 1))
+        return found
+
+    def count(self, tokens: List[str]) -> int:
+        matches = self.find(tokens)
+        if len(matches) < 2:
+            return len(matches)
+
+        used = bytearray(len(tokens))
+        count = 0
+        for start, length in sorted(matches, key=lambda m: (-m[1], m[0])):
+            if any(used[start:start + length]):
                 continue
-            ngram = " ".join(tokens[i:i+n])
-            if ngram in geo_terms:
-                count += 1
-                used.update(span_idx)
-                i += n
-            else:
-                i += 1
-    return count
-
-def compute_entities_features(answer_text: str) -> Dict[str, float]:
-    text = (answer_text or "").strip()
-    sent_dict = split_sentences_as_dict(text)  # {0: {"raw": str, "tokens": [..]}, ...}
-    tokens = [tok.lower() for s in sent_dict.values() for tok in s["tokens"]]
+            used[start:start + length] = b"\x01" * length
+            count += 1
+        return count
+
+def get_geo_matcher() -> GeoTermMatcher:
+    global _geo_matcher
+    if _geo_matcher is None:
+        _geo_matcher = GeoTermMatcher(get_geo_terms())
+    return _geo_matcher
+
+def __getattr__(name: str):
+    if name == "country_names":
+        return _country_names()
+    if name == "geo_terms":
+        return get_geo_terms()
+    if name == "GEO_MATCHER":
+        return get_geo_matcher()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def load_geonames_terms(path: str, include_alternates: bool = False) -> set[str]:
+    """
+    Read place names from a GeoNames dump (e.g. cities15000.txt) as lowercased terms,
+    ready for get_geo_matcher().add_terms or a custom GeoTermMatcher.
+    """
+    terms = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 4:
+                continue
+            names = [cols[1], cols[2]]
+            if include_alternates and cols[3]:
+                names.extend(cols[3].split(","))
+            terms.update(name.strip().lower() for name in names if name.strip())
+    return terms
+
+# Matchers built for caller-supplied gazetteer sets, by set identity; an entry
+# goes away with its set and is rebuilt if the set's size changes
+_set_matchers: Dict[int, Tuple["weakref.ref[set[str]]", int, GeoTermMatcher]] = {}
+
+def _matcher_for(terms: set[str]) -> GeoTermMatcher:
+    key = id(terms)
+    entry = _set_matchers.get(key)
+    if entry is not None and entry[0]() is terms and entry[1] == len(terms):
+        return entry[2]
+    matcher = GeoTermMatcher(terms)
+    _set_matchers[key] = (weakref.ref(terms, lambda _, key=key: _set_matchers.pop(key, None)), len(terms), matcher)
+    return matcher
+
+def count_geo_terms(tokens: list[str], geo_terms: Union[set[str], GeoTermMatcher, None] = None) -> int:
+    """
+    Count non-overlapping gazetteer matches, preferring trigrams, then bigrams, then unigrams.
+
+    A set of terms is compiled into a GeoTermMatcher once and reused for later
+    calls with the same set object; pass a GeoTermMatcher (and use add_terms)
+    if the gazetteer is edited in place without changing its size.
+    """
+    if geo_terms is None or geo_terms is _geo_terms:
+        matcher = get_geo_matcher()
+    elif isinstance(geo_terms, GeoTermMatcher):
+        matcher = geo_terms
+    else:
+        matcher = _matcher_for(geo_terms)
+    return matcher.count(tokens)
+
+def compute_entities_features(
+    answer_text: Union[str, ParsedDocument],
+    geo_matcher: Optional[GeoTermMatcher] = None,
+) -> Dict[str, float]:
+    doc = parse_document(answer_text)
+    text = doc.text
+    tokens = doc.flat_tokens
     token_count = len(tokens)
     
     if not tokens:
@@ -73,13 +188,12 @@ def compute_entities_features(answer_text: str) -> Dict[str, float]:
     currency_count = len(CURRENCY_PATTERN.findall(text))    
     
     # Geographic matches
-    geo_count = count_geo_terms(tokens, geo_terms)   
+    geo_count = (geo_matcher or get_geo_matcher()).count(tokens)
     
     # Capitalized words
     # Skips first word in sentence, just trying to ID proper nouns
     cap_count = 0
-    for s in split_sentences_as_dict(text, make_lower=False).values():
-        raw_tokens = clean_and_tokenize(s["raw"], make_lower=False)
+    for raw_tokens in doc.raw_tokens:
         for i, tok in enumerate(raw_tokens):
             if i == 0:
                 continue
@@ -1,8 +1,8 @@
 # lexical.py
 
-from typing import Dict, List
+from typing import Dict, List, Union
 from collections import Counter
-from .readability import split_sentences_as_dict
+from .readability import ParsedDocument, parse_document
 
 STOPWORDS = {
     "the", "a", "an", "and", "or", "but", "if", "then", "of", "on", "in", "to",
@@ -11,12 +11,10 @@ STOPWORDS = {
     "them", "his", "her", "their", "we", "you", "i", "me", "my", "your", "our"
 }
 
-def compute_lexical_features(answer_text: str) -> Dict[str, float]:
+def compute_lexical_features(answer_text: Union[str, ParsedDocument]) -> Dict[str, float]:
     
-    text = (answer_text or "").strip().lower()
-    sent_dict = split_sentences_as_dict(text)  # {0: {"raw": str, "tokens": [..]}, ...}
-    
-    tokens = [tok for s in sent_dict.values() for tok in s["tokens"]]
+    doc = parse_document(answer_text)
+    tokens = doc.flat_tokens
     if not tokens: 
         return {
             "unique_token_count": 0.0,
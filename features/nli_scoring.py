@@ -1,27 +1,206 @@
 # nli_scoring.py
 
-from transformers.pipelines import pipeline
-from typing import Any
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import sqlite3
 
 
+NLI_MODEL = "roberta-large-mnli"
+DEFAULT_BATCH_SIZE = 32
+
 _nli = None
 def _get_nli():
     global _nli
     if _nli is None:
-        _nli = pipeline("text-classification", model="roberta-large-mnli")
+        # transformers/torch are only imported once NLI is actually needed
+        from transformers.pipelines import pipeline
+        _nli = pipeline("text-classification", model=NLI_MODEL)
     return _nli
 
-def score_nli(question: str, answer: str) -> dict[str, float]:
-    nli_pipeline = _get_nli()
-    outputs = nli_pipeline({"text": question, "text_pair": answer}, top_k=None)
+def _text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+class NLICache:
+    """
+    Content-addressed cache of NLI scores keyed by (model, premise hash, hypothesis hash).
+
+    An in-memory LRU sits in front of an optional SQLite file, so reruns over the
+    same answers skip the transformer entirely. Hit/miss counters are kept per process.
+    """
+    def __init__(self, path: Optional[str] = None, model: str = NLI_MODEL, max_memory: int = 100_000):
+        self.path = path
+        self.model = model
+        self.max_memory = max_memory
+        self._memory: "OrderedDict[Tuple[str, str, str], dict[str, float]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if not self.path:
+            return None
+        # sqlite connections must not cross a fork; reopen in child processes
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS nli_scores ("
+                " model TEXT NOT NULL, premise TEXT NOT NULL, hypothesis TEXT NOT NULL,"
+                " scores TEXT NOT NULL, PRIMARY KEY (model, premise, hypothesis)"
+                ") WITHOUT ROWID"
+            )
+            self._conn.commit()
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def key(self, premise: str, hypothesis: str) -> Tuple[str, str, str]:
+        return (self.model, _text_hash(premise), _text_hash(hypothesis))
+
+    def _remember(self, key: Tuple[str, str, str], scores: dict[str, float]) -> None:
+        self._memory[key] = scores
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
 
-    # Hugging Face returns a list of dicts like:
-    # [{'label': 'ENTAILMENT', 'score': 0.9}, {'label': 'NEUTRAL', 'score': 0.05}, {'label': 'CONTRADICTION', 'score': 0.05}]
-    if not isinstance(outputs, list):
-        return {"ENTAILMENT": 0.0, "NEUTRAL": 0.0, "CONTRADICTION": 0.0}
+    def get(self, key: Tuple[str, str, str]) -> Optional[dict[str, float]]:
+        scores = self._memory.get(key)
+        if scores is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return dict(scores)
 
-    scores = {item["label"]: float(item["score"]) for item in outputs if isinstance(item, dict)}
-    return scores
+        db = self._db()
+        if db is not None:
+            found = db.execute(
+                "SELECT scores FROM nli_scores WHERE model = ? AND premise = ? AND hypothesis = ?", key
+            ).fetchone()
+            if found is not None:
+                scores = json.loads(found[0])
+                self._remember(key, scores)
+                self.disk_hits += 1
+                return dict(scores)
+
+        self.misses += 1
+        return None
+
+    def put_many(self, items: Dict[Tuple[str, str, str], dict[str, float]]) -> None:
+        for key, scores in items.items():
+            self._remember(key, scores)
+        db = self._db()
+        if db is not None and items:
+            db.executemany(
+                "INSERT OR REPLACE INTO nli_scores (model, premise, hypothesis, scores) VALUES (?, ?, ?, ?)",
+                [(*key, json.dumps(scores)) for key, scores in items.items()],
+            )
+            db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+    def report(self) -> str:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        rate = hits / total if total else 0.0
+        return (
+            f"NLI cache: {hits}/{total} hits ({rate:.1%}; "
+            f"memory={self.memory_hits}, disk={self.disk_hits}), misses={self.misses}"
+        )
+
+    def close(self) -> None:
+        if self._conn is not None and self._conn_pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+_cache = NLICache()
+def configure_nli_cache(path: Optional[str] = None, max_memory: int = 100_000) -> NLICache:
+    """
+    Replace the module cache. Pass a file path to persist scores across runs,
+    or None to keep them in memory only.
+    """
+    global _cache
+    _cache.close()
+    _cache = NLICache(path=path, max_memory=max_memory)
+    return _cache
+
+def get_nli_cache() -> NLICache:
+    return _cache
+
+def _run_batch(nli_pipeline: Any, batch: Sequence[Tuple[str, str]]) -> List[dict[str, float]]:
+    import torch
+
+    tokenizer = nli_pipeline.tokenizer
+    model = nli_pipeline.model
+
+    # Dynamic padding: pad only up to the longest pair in this batch
+    enc = tokenizer(
+        [p for p, _ in batch],
+        [h for _, h in batch],
+        padding="longest",
+        return_tensors="pt",
+    ).to(model.device)
+
+    with torch.inference_mode():
+        probs = torch.softmax(model(**enc).logits, dim=-1).cpu().tolist()
+
+    id2label = model.config.id2label
+    return [
+        {id2label[i]: float(p) for i, p in enumerate(row)}
+        for row in probs
+    ]
+
+def score_nli_batch(pairs: Iterable[Tuple[str, str]], batch_size: int = DEFAULT_BATCH_SIZE) -> List[dict[str, float]]:
+    """
+    Score many (premise, hypothesis) pairs with the NLI model.
+
+    Pairs are looked up in the NLI cache first; the remaining ones are sorted
+    by length before batching so each forward pass pads as little as possible.
+    Results are returned in the input order, one dict with keys
+    "ENTAILMENT", "NEUTRAL", "CONTRADICTION" per pair.
+    """
+    pairs = [(str(p), str(h)) for p, h in pairs]
+    if not pairs:
+        return []
+
+    cache = get_nli_cache()
+    keys = [cache.key(p, h) for p, h in pairs]
+    results: List[Optional[dict[str, float]]] = [None] * len(pairs)
+
+    # Serve cached pairs; score each missing pair once even if repeated in the input
+    todo: Dict[Tuple[str, str, str], int] = {}
+    for i, key in enumerate(keys):
+        if key in todo:
+            continue
+        results[i] = cache.get(key)
+        if results[i] is None:
+            todo[key] = i
+
+    if todo:
+        nli_pipeline = _get_nli()
+        missing = sorted(todo.values(), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        fresh: Dict[Tuple[str, str, str], dict[str, float]] = {}
+        for start in range(0, len(missing), batch_size):
+            idx = missing[start:start + batch_size]
+            for i, scores in zip(idx, _run_batch(nli_pipeline, [pairs[i] for i in idx])):
+                fresh[keys[i]] = scores
+        cache.put_many(fresh)
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                results[i] = dict(fresh[key])
+
+    return results  # type: ignore[return-value]
+
+def score_nli(question: str, answer: str) -> dict[str, float]:
+    return score_nli_batch([(question, answer)])[0]
 
 def score_answer_vs_bta(bta_text: str, cand_answer: str) -> dict[str, float]:
     """
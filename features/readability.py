@@ -1,10 +1,9 @@
 # readability.py
 
 from __future__ import annotations
-from typing import Any, Dict
+from typing import Any, Dict, List, Union
 import math
 import re
-import textstat
 
 # Keep contractions/hyphenated words
 WORD_RE = re.compile(r"[A-Za-z0-9]+(?:['-][A-Za-z0-9]+)*")
@@ -12,6 +11,11 @@ WORD_RE = re.compile(r"[A-Za-z0-9]+(?:['-][A-Za-z0-9]+)*")
 TERMINATORS = [".", "!", "?"]
 LINE_BREAKS = ["\n", "\r"]
 
+def _textstat():
+    # textstat pulls in pkg_resources/pyphen; import it only when readability is computed
+    import textstat
+    return textstat
+
 def clean_and_tokenize(sentence: str, make_lower: bool = True) -> list[str]:
     WORD_RE = re.compile(r"[A-Za-z0-9]+(?:['-][A-Za-z0-9]+)*")
 
@@ -22,46 +26,68 @@ def clean_and_tokenize(sentence: str, make_lower: bool = True) -> list[str]:
     words = WORD_RE.findall(sentence)
     return words
 
-def split_sentences_as_dict(text: str, make_lower: bool = True) -> Dict[int, Dict[str, Any]]:
-    """
-    Split text into sentences and return a dict with raw text and cleaned tokens.
-    Example:
-    {
-      0: {"raw": "This is the first.", "tokens": ["this", "is", "the", "first"]},
-      1: {"raw": "Second one!", "tokens": ["second", "one"]}
-    }
-    """
+def _split_sentences(text: str) -> List[str]:
     for br in LINE_BREAKS:
         text = text.replace(br, " ")
     text = text.strip()
     if not text:
-        return {}
+        return []
 
     if not any(p in text for p in TERMINATORS):
-        return {0: {"raw": text, "tokens": clean_and_tokenize(text, make_lower=make_lower)}}
+        return [text]
 
     pattern = "[" + re.escape("".join(TERMINATORS)) + "]"
     parts = re.split(pattern, text)
-    parts = [p.strip() for p in parts if p.strip()]
+    return [p.strip() for p in parts if p.strip()]
 
+def split_sentences_as_dict(text: str, make_lower: bool = True) -> Dict[int, Dict[str, Any]]:
+    """
+    Split text into sentences and return a dict with raw text and cleaned tokens.
+    Example:
+    {
+      0: {"raw": "This is the first.", "tokens": ["this", "is", "the", "first"]},
+      1: {"raw": "Second one!", "tokens": ["second", "one"]}
+    }
+    """
     return {
         i: {"raw": s, "tokens": clean_and_tokenize(s, make_lower=make_lower)}
-        for i, s in enumerate(parts)
+        for i, s in enumerate(_split_sentences(text))
     }
 
-def compute_readability(answer_text: str) -> Dict[str, float]:
+class ParsedDocument:
+    """
+    An answer split into sentences and tokenized once, shared by every extractor.
+
+    `tokens` holds the lowercased tokens per sentence (what split_sentences_as_dict
+    returns), `raw_tokens` the same tokens with their original casing.
+    """
+    __slots__ = ("text", "sentences", "tokens", "raw_tokens", "flat_tokens")
+
+    def __init__(self, text: str):
+        self.text = (text or "").strip()
+        self.sentences = _split_sentences(self.text)
+        self.raw_tokens = [WORD_RE.findall(s) for s in self.sentences]
+        self.tokens = [WORD_RE.findall(s.lower()) for s in self.sentences]
+        self.flat_tokens = [tok for sent in self.tokens for tok in sent]
+
+def parse_document(text: Union[str, ParsedDocument, None]) -> ParsedDocument:
+    if isinstance(text, ParsedDocument):
+        return text
+    return ParsedDocument(text or "")
+
+def compute_readability(answer_text: Union[str, ParsedDocument]) -> Dict[str, float]:
     """
     Compute readability features for a single ANSWER string,
     using textstat for FE/FK and our richer sentence dict for length stats.
     """
-    text = (answer_text or "").strip()
+    doc = parse_document(answer_text)
+    text = doc.text
+    textstat = _textstat()
 
     fe = float(textstat.flesch_reading_ease(text)) if text else 0.0 # type: ignore
     fk = float(textstat.flesch_kincaid_grade(text)) if text else 0.0 # type: ignore
 
-    sent_dict = split_sentences_as_dict(text) 
-
-    if not sent_dict:
+    if not doc.sentences:
         return {
             "reading_ease": fe,
             "fk_grade": fk,
@@ -71,7 +97,7 @@ def compute_readability(answer_text: str) -> Dict[str, float]:
             "sentence_len_std": 0.0,
         }
 
-    lengths = [len(s["tokens"]) for s in sent_dict.values()]
+    lengths = [len(tokens) for tokens in doc.tokens]
     sentence_count = len(lengths)
     token_count = sum(lengths)
 
@@ -1,11 +1,10 @@
 #style.py
 
 import math
-from typing import Dict
+from functools import lru_cache
+from typing import Dict, FrozenSet, Tuple, Union
 
-from nltk.stem import PorterStemmer
-from nltk.stem import WordNetLemmatizer
-from .readability import split_sentences_as_dict
+from .readability import ParsedDocument, parse_document
 
 NEGATORS = {
     "no", "not", "never", "none", "nothing", "nowhere", "neither",
@@ -26,28 +25,51 @@ BOOSTERS = {
     "completely", "entirely", "totally", "forever", "perfectly"
 }
 
-stemmer = PorterStemmer()
-lemmatizer = WordNetLemmatizer()
-    
+# nltk (and the WordNet corpus behind the lemmatizer) is loaded on first use
+_stemmer = None
+_lemmatizer = None
+
+def _get_stemmer():
+    global _stemmer
+    if _stemmer is None:
+        from nltk.stem import PorterStemmer
+        _stemmer = PorterStemmer()
+    return _stemmer
+
+def _get_lemmatizer():
+    global _lemmatizer
+    if _lemmatizer is None:
+        from nltk.stem import WordNetLemmatizer
+        _lemmatizer = WordNetLemmatizer()
+    return _lemmatizer
+
+@lru_cache(maxsize=100_000)
 def normalize_token(tok: str, method="lemma") -> str:
     tok = tok.lower()
     
     
     if method == "stem":
-        return stemmer.stem(tok)
+        return _get_stemmer().stem(tok)
     elif method == "lemma":
-        return lemmatizer.lemmatize(tok)
+        return _get_lemmatizer().lemmatize(tok)
     return tok
 
 def normalize_lexicon(words, method="exact"):
     return {normalize_token(w, method) for w in words}
 
-def compute_style_features(answer_text: str, norm: str = "exact") -> Dict[str, float]:
-    
-    text = (answer_text or "").strip()
-    sent_dict = split_sentences_as_dict(text)  # {0: {"raw": str, "tokens": [..]}, ...}
+@lru_cache(maxsize=None)
+def normalized_lexicons(method: str = "exact") -> Tuple[FrozenSet[str], FrozenSet[str], FrozenSet[str]]:
+    """Negator, hedge and booster lexicons normalized with `method`, built once per method."""
+    return (
+        frozenset(normalize_lexicon(NEGATORS, method=method)),
+        frozenset(normalize_lexicon(HEDGES, method=method)),
+        frozenset(normalize_lexicon(BOOSTERS, method=method)),
+    )
 
-    tokens = [tok for s in sent_dict.values() for tok in s["tokens"]]
+def compute_style_features(answer_text: Union[str, ParsedDocument], norm: str = "exact") -> Dict[str, float]:
+    
+    doc = parse_document(answer_text)
+    tokens = doc.flat_tokens
     token_count = len(tokens)
     
     if not tokens:
@@ -62,9 +84,7 @@ def compute_style_features(answer_text: str, norm: str = "exact") -> Dict[str, f
     # Normalize tokens and lexicons according to chosen method
     tokens_lower = [t.lower() for t in tokens]
     tokens_norm = [normalize_token(t, method=norm) for t in tokens_lower]
-    negators_norm = normalize_lexicon(NEGATORS, method=norm)
-    hedges_norm = normalize_lexicon(HEDGES, method=norm)
-    boosters_norm = normalize_lexicon(BOOSTERS, method=norm)
+    negators_norm, hedges_norm, boosters_norm = normalized_lexicons(norm)
 
     neg_count = sum(t in negators_norm for t in tokens_norm)
     hedge_count = sum(t in hedges_norm for t in tokens_norm)
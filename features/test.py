@@ -2,13 +2,55 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from features.readability import clean_and_tokenize, split_sentences_as_dict, compute_readability
+from features.readability import clean_and_tokenize, split_sentences_as_dict, compute_readability, ParsedDocument
 from features.lexical import compute_lexical_features as compute_lexical
 from features.style import compute_style_features
-from features.entities import compute_entities_features as compute_entity_features
+import features.entities as entities
+from features.entities import compute_entities_features as compute_entity_features, GeoTermMatcher, count_geo_terms
 
+from features.aggregate_features import process_answer, process_question
+from features.batch import compute_features_batch
+import features.nli_scoring as nli_scoring
+import features.consistency as consistency
+from features.consistency import semantic_clusters, cluster_entropy, lexical_diversity, process_samples
+
+import hashlib
+import math
+import subprocess
+import tempfile
 import pycountry
 
+def _stub_nli(scores_for):
+    """Swap the NLI model for `scores_for(premise, hypothesis)`; returns the list of scored pairs and a restore function."""
+    scored = []
+    saved = nli_scoring._get_nli, nli_scoring._run_batch, nli_scoring.get_nli_cache()
+
+    def run_batch(nli, batch):
+        scored.extend(batch)
+        return [scores_for(p, h) for p, h in batch]
+
+    def restore():
+        nli_scoring._get_nli, nli_scoring._run_batch, nli_scoring._cache = saved
+
+    nli_scoring._get_nli, nli_scoring._run_batch = (lambda: None), run_batch
+    nli_scoring._cache = nli_scoring.NLICache()
+    return scored, restore
+
+def _pair_scores(premise, hypothesis):
+    # distinct, deterministic scores per pair
+    e = (len(premise) * 31 + len(hypothesis)) % 97 / 100
+    return {"ENTAILMENT": e, "NEUTRAL": (1 - e) / 2, "CONTRADICTION": (1 - e) / 2, "pair": f"{premise}|{hypothesis}"}
+
+def _hashed_scores(premise, hypothesis):
+    digest = hashlib.md5(f"{premise}|{hypothesis}".encode()).digest()
+    e, c = digest[0] + 1, digest[1] + 1
+    return {"ENTAILMENT": e / (e + c + 10), "NEUTRAL": 10 / (e + c + 10), "CONTRADICTION": c / (e + c + 10)}
+
+def _same_row(a, b):
+    return a.keys() == b.keys() and all(
+        a[k] == b[k] or (isinstance(a[k], float) and math.isnan(a[k]) and math.isnan(b[k])) for k in a
+    )
+
 # Readability Tests #
 
 def test_clean_and_tokenize():
@@ -30,6 +72,21 @@ def test_split_sentences_as_dict():
         assert "raw" in s and "tokens" in s
         assert isinstance(s["tokens"], list)
 
+def test_parsed_document_matches_sentence_dict():
+    text = "Alice met Bob in New York. They didn't stay long!\nThen 2020 came"
+    doc = ParsedDocument(text)
+    lower = split_sentences_as_dict(text)
+    raw = split_sentences_as_dict(text, make_lower=False)
+
+    assert doc.sentences == [s["raw"] for s in lower.values()]
+    assert doc.tokens == [s["tokens"] for s in lower.values()]
+    assert doc.raw_tokens == [s["tokens"] for s in raw.values()]
+    assert doc.flat_tokens == [t for s in lower.values() for t in s["tokens"]]
+
+    # Extractors give the same result for the text and its parsed document
+    for fn in (compute_readability, compute_lexical, compute_style_features, compute_entity_features):
+        assert fn(doc) == fn(text)
+
 def test_compute_readability():
     text = "This is a short example. It should be easy to read."
     result = compute_readability(text)
@@ -160,6 +217,35 @@ def test_geo_terms():
     assert out["entity_geo_count"] >= 2.0
     print("geo:", pretty(out))
 
+def test_geo_matcher_prefers_longer_terms():
+    matcher = GeoTermMatcher(["new york", "york", "new", "b c d", "a b", "a"])
+    # trigram "b c d" is taken before bigram "a b", then "a" still counts on its own
+    assert matcher.count(["a", "b", "c", "d"]) == 2
+    assert matcher.count(["new", "york", "york"]) == 2
+    assert matcher.count([]) == 0
+    # terms longer than max_len are ignored, like the original n <= 3 scan
+    assert GeoTermMatcher(["saint vincent and the grenadines"]).count(
+        ["saint", "vincent", "and", "the", "grenadines"]) == 0
+
+def test_count_geo_terms_reuses_matcher_per_set():
+    gazetteer = {"springfield", "shelbyville", "north haverbrook"}
+    built = []
+    init = GeoTermMatcher.__init__
+    def counting_init(self, *args, **kwargs):
+        built.append(self)
+        init(self, *args, **kwargs)
+    GeoTermMatcher.__init__ = counting_init
+    try:
+        tokens = ["from", "north", "haverbrook", "to", "springfield"]
+        assert [count_geo_terms(tokens, gazetteer) for _ in range(3)] == [2, 2, 2]
+        assert len(built) == 1
+        gazetteer.add("capital city")  # a resized set is recompiled
+        assert count_geo_terms(["capital", "city"], gazetteer) == 1 and len(built) == 2
+    finally:
+        GeoTermMatcher.__init__ = init
+    del gazetteer
+    assert not entities._set_matchers
+
 def test_capitalized_proxy():
     # Proper-noun-ish words; note: our tokenizer lowercases tokens,
     # so capitalized count is conservative. This test just ensures the call works.
@@ -169,10 +255,176 @@ def test_capitalized_proxy():
     assert out["entity_ratio"] >= 0.0
     print("capitalized proxy:", pretty(out))
     
+# Import Budget #
+
+IMPORT_BUDGET_SECONDS = 0.5
+HEAVY_MODULES = ("transformers", "torch", "textstat", "pycountry", "nltk", "pandas")
+
+def test_import_time_budget():
+    # Fresh interpreter so nothing is already cached in sys.modules
+    code = (
+        "import sys, time\n"
+        "t = time.perf_counter()\n"
+        "import features, features.aggregate_features, features.nli_scoring\n"
+        "elapsed = time.perf_counter() - t\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(elapsed, ','.join(heavy))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    elapsed, _, heavy = out.stdout.strip().partition(" ")
+    print(f"import features: {float(elapsed):.3f}s")
+    assert heavy == "", f"heavy modules imported eagerly: {heavy}"
+    assert float(elapsed) < IMPORT_BUDGET_SECONDS
+
+# Batch Tests #
+
+def test_batch_matches_scalar():
+    texts = [
+        "The watermelon seeds pass through your digestive system.",
+        "It might be true, but it is not definitely guaranteed. Maybe!",
+        "In 1999 the device cost $299.99 in New York and North Carolina.",
+        "hello hello hello hello",
+        "",
+        "Alice met Bob at OpenAI in San Francisco.\nThey didn't stay long?",
+    ]
+    batch = compute_features_batch(texts)
+    assert list(batch.index) == list(range(len(texts)))
+
+    for i, text in enumerate(texts):
+        expected = {}
+        expected.update(compute_readability(text))
+        expected.update(compute_lexical(text))
+        expected.update(compute_style_features(text, norm="lemma"))
+        expected.update(compute_entity_features(text))
+        for key, val in expected.items():
+            assert math.isclose(batch.loc[i, key], val, rel_tol=1e-9, abs_tol=1e-12), (text, key)
+
+# Consistency Tests #
+
+def test_semantic_clusters_and_entropy():
+    ent = {"ENTAILMENT": 0.9, "NEUTRAL": 0.05, "CONTRADICTION": 0.05}
+    con = {"ENTAILMENT": 0.05, "NEUTRAL": 0.05, "CONTRADICTION": 0.9}
+    texts = ["Paris", "It is Paris", "London", "Paris, France"]
+    same = {("Paris", "It is Paris"), ("Paris", "Paris, France"), ("It is Paris", "Paris, France")}
+    nli = {
+        (a, b): ent if (a, b) in same or (b, a) in same else con
+        for a in texts for b in texts if a != b
+    }
+    nli[("Paris, France", "Paris")] = con  # one-way entailment is not enough
+    labels = semantic_clusters(texts, nli)
+    assert labels == [0, 0, 1, 2]
+    assert math.isclose(cluster_entropy(labels), -(0.5 * math.log(0.5) + 2 * 0.25 * math.log(0.25)))
+    assert cluster_entropy([0, 0, 0]) == 0.0
+    assert math.copysign(1.0, cluster_entropy([0, 0, 0])) == 1.0  # not -0.0
+
+def test_process_samples_scores_unique_pairs_once():
+    ent = {"ENTAILMENT": 0.9, "NEUTRAL": 0.05, "CONTRADICTION": 0.05}
+    con = {"ENTAILMENT": 0.05, "NEUTRAL": 0.05, "CONTRADICTION": 0.9}
+    paris = {"Paris", "It is Paris"}
+    scored = []
+
+    def fake_score_nli_batch(pairs, batch_size=None):
+        scored.extend(pairs)
+        return [ent if a in paris and b in paris else con for a, b in pairs]
+
+    score_nli_batch = consistency.score_nli_batch
+    consistency.score_nli_batch = fake_score_nli_batch
+    try:
+        answers = ["Paris", "London", " Paris ", "It is Paris", "London"]
+        rows = process_samples(7, "Capital of France?", [{"answer": a, "Temperature": t} for t, a in enumerate(answers)])
+    finally:
+        consistency.score_nli_batch = score_nli_batch
+
+    # 3 unique texts -> 6 ordered pairs, each scored once
+    assert len(scored) == 6 and len(set(scored)) == 6
+    assert [r["Temperature"] for r in rows] == [0, 1, 2, 3, 4]
+    assert [r["semantic_cluster"] for r in rows] == [0, 1, 0, 0, 1]
+    assert [r["semantic_cluster_share"] for r in rows] == [0.6, 0.4, 0.6, 0.6, 0.4]
+    assert rows[0]["sample_count"] == 5.0 and rows[0]["sample_unique_count"] == 3.0
+    assert rows[0]["semantic_cluster_count"] == 2.0
+    assert math.isclose(rows[0]["semantic_entropy"], -(0.6 * math.log(0.6) + 0.4 * math.log(0.4)))
+
+# NLI Tests #
+
+def test_score_nli_batch_keeps_input_order_and_dedupes():
+    scored, restore = _stub_nli(_pair_scores)
+    try:
+        pairs = [("a much longer premise here", "b"), ("q", "a"), ("q", "a"), ("mid premise", "hyp"), ("q", "a")]
+        results = nli_scoring.score_nli_batch(pairs, batch_size=2)
+    finally:
+        restore()
+    assert [r["pair"] for r in results] == [f"{p}|{h}" for p, h in pairs]
+    assert sorted(scored) == sorted(set(pairs))  # repeated pair scored once
+    assert scored[0] == ("q", "a")  # shortest first
+    results[1]["ENTAILMENT"] = -1.0
+    assert results[2]["ENTAILMENT"] != -1.0  # each result is its own dict
+
+def test_nli_cache_persists_evicts_and_counts():
+    pairs = [("q", "a"), ("q", "b"), ("q", "c")]
+    scored, restore = _stub_nli(_pair_scores)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "nli.sqlite")
+            cache = nli_scoring.configure_nli_cache(path, max_memory=2)
+            first = nli_scoring.score_nli_batch(pairs)
+            assert len(scored) == 3 and cache.stats() == {"memory_hits": 0, "disk_hits": 0, "misses": 3}
+
+            # LRU keeps the last two; the evicted pair comes back from disk
+            nli_scoring.score_nli_batch([("q", "c"), ("q", "a")])
+            assert cache.stats() == {"memory_hits": 1, "disk_hits": 1, "misses": 3}
+
+            # Returned dicts are copies of the cached scores
+            first[0]["ENTAILMENT"] = -1.0
+            assert nli_scoring.score_nli_batch([("q", "a")])[0]["ENTAILMENT"] != -1.0
+
+            # A fresh cache on the same file (a second run) is served from disk
+            cache = nli_scoring.configure_nli_cache(path)
+            again = nli_scoring.score_nli_batch(pairs)
+            assert len(scored) == 3
+            assert cache.stats() == {"memory_hits": 0, "disk_hits": 3, "misses": 0}
+            assert [r["pair"] for r in again] == [r["pair"] for r in first]
+            cache.close()
+    finally:
+        restore()
+
+def test_process_question_matches_process_answer():
+    cases = [
+        # duplicates and a whitespace variant of the best answer
+        (["Paris", " Paris", "Paris", "It is Paris"], ["London", "Rome"], "Paris", "London"),
+        # no BTA
+        (["Yes"], ["No", "No"], None, None),
+    ]
+    _, restore = _stub_nli(_hashed_scores)
+    try:
+        for true_answers, false_answers, bta, bfa in cases:
+            all_answers = true_answers + false_answers
+            rows = process_question(3, "Capital of France?", true_answers, false_answers,
+                                    best_true_text=bta, best_false_text=bfa)
+            expected = [
+                process_answer(3, "Capital of France?", ans, all_answers,
+                               is_true=ans in true_answers,
+                               is_best=ans == (bta if ans in true_answers else bfa), bta_text=bta)
+                for ans in all_answers
+            ]
+            assert len(rows) == len(expected)
+            for row, exp in zip(rows, expected):
+                assert _same_row(row, exp), row["answer"]
+    finally:
+        restore()
+
+def test_lexical_diversity():
+    same = lexical_diversity([["a", "b"], ["a", "b"]])
+    assert same["sample_distinct_1"] == 0.5 and same["sample_jaccard_distance_mean"] == 0.0
+    disjoint = lexical_diversity([["a", "b"], ["c", "d"]])
+    assert disjoint["sample_distinct_1"] == 1.0 and disjoint["sample_distinct_2"] == 1.0
+    assert disjoint["sample_jaccard_distance_mean"] == 1.0
+
 if __name__ == "__main__":
     tests = [
         ("test_clean_and_tokenize", test_clean_and_tokenize),
         ("test_split_sentences_as_dict", test_split_sentences_as_dict),
+        ("test_parsed_document_matches_sentence_dict", test_parsed_document_matches_sentence_dict),
         ("test_compute_readability", test_compute_readability),
         ("test_empty_text", test_empty_text),
         ("test_repetition_extreme", test_repetition_extreme),
@@ -187,7 +439,17 @@ if __name__ == "__main__":
         ("test_numbers_and_currency", test_numbers_and_currency),
         ("test_years", test_years),
         ("test_geo_terms", test_geo_terms),
+        ("test_geo_matcher_prefers_longer_terms", test_geo_matcher_prefers_longer_terms),
+        ("test_count_geo_terms_reuses_matcher_per_set", test_count_geo_terms_reuses_matcher_per_set),
         ("test_capitalized_proxy", test_capitalized_proxy),
+        ("test_import_time_budget", test_import_time_budget),
+        ("test_batch_matches_scalar", test_batch_matches_scalar),
+        ("test_semantic_clusters_and_entropy", test_semantic_clusters_and_entropy),
+        ("test_process_samples_scores_unique_pairs_once", test_process_samples_scores_unique_pairs_once),
+        ("test_score_nli_batch_keeps_input_order_and_dedupes", test_score_nli_batch_keeps_input_order_and_dedupes),
+        ("test_nli_cache_persists_evicts_and_counts", test_nli_cache_persists_evicts_and_counts),
+        ("test_process_question_matches_process_answer", test_process_question_matches_process_answer),
+        ("test_lexical_diversity", test_lexical_diversity),
     ]
 
     for name, func in tests:
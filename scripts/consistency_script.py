@@ -0,0 +1,82 @@
+# scripts/consistency_script.py
+import os
+import sys
+import argparse
+from typing import Any, Dict, Iterator, List, Tuple
+import pandas as pd
+from tqdm import tqdm
+
+# add project root to sys.path so imports work
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from features.consistency import process_samples
+from features.nli_scoring import DEFAULT_BATCH_SIZE, configure_nli_cache
+from data_pipeline.writers import BufferedRowWriter
+from data_pipeline.stages import DEFAULT_NLI_CACHE
+
+
+def _read_results(path: str) -> pd.DataFrame:
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if path.endswith(".jsonl"):
+        return pd.read_json(path, lines=True)
+    return pd.read_csv(path)
+
+
+def _iter_sample_groups(df: pd.DataFrame) -> Iterator[Tuple[Any, str, List[Dict[str, Any]]]]:
+    """
+    (qid, question, samples) per question; failed generations are left out.
+    Older result files without a QID column are grouped by question text.
+    """
+    df = df[~df["Answer"].astype(str).str.startswith("API_ERROR")]
+    key = "QID" if "QID" in df.columns else "Question"
+    for qid, group in df.groupby(key, sort=False):
+        samples = [
+            {"temperature": t, "answer": str(a)}
+            for t, a in zip(group["Temperature"], group["Answer"])
+        ]
+        yield qid, group["Question"].iloc[0], samples
+
+
+def main(in_path, out_path, preview_n=None, nli_batch_size=DEFAULT_BATCH_SIZE, nli_cache_path=DEFAULT_NLI_CACHE,
+         output_format="jsonl"):
+    nli_cache = configure_nli_cache(nli_cache_path)
+
+    df = _read_results(in_path)
+    key = "QID" if "QID" in df.columns else "Question"
+    if preview_n:
+        df = df[df[key].isin(df[key].drop_duplicates().head(preview_n))]
+
+    writer = BufferedRowWriter(out_path, output_format, mode="w")
+    try:
+        for qid, question, samples in tqdm(_iter_sample_groups(df), total=df[key].nunique(), desc="Questions"):
+            writer.write_rows(process_samples(qid, question, samples, batch_size=nli_batch_size))
+    finally:
+        writer.close()
+
+    print(f"Wrote {writer.rows_written} rows to {out_path}")
+    print(nli_cache.report())
+    nli_cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-question consistency features over multiple sampled answers")
+    parser.add_argument("input", type=str, help="Generation results (QID, Question, Temperature, Answer) as CSV, JSONL or Parquet")
+    parser.add_argument("output", type=str, help="Output file, one row per sample")
+    parser.add_argument("--preview", type=int, default=None, help="Only process the first N questions")
+    parser.add_argument(
+        "--nli-batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+        help="Number of (premise, hypothesis) pairs per NLI forward pass"
+    )
+    parser.add_argument(
+        "--nli-cache", type=str, default=DEFAULT_NLI_CACHE,
+        help="SQLite file used to persist NLI scores across runs"
+    )
+    parser.add_argument("--no-nli-cache", action="store_true", help="Keep NLI scores in memory only")
+    parser.add_argument("--format", choices=["jsonl", "csv", "parquet"], default="jsonl", help="Output format")
+    args = parser.parse_args()
+
+    main(
+        args.input, args.output, args.preview, args.nli_batch_size,
+        nli_cache_path=None if args.no_nli_cache else args.nli_cache,
+        output_format=args.format,
+    )
@@ -1,16 +1,16 @@
 # scripts/features_script.py
-import ast
 import sys
 import os
-import json
 import argparse
-from typing import List
 import pandas as pd
 from tqdm import tqdm
 
 # add project root to sys.path so imports work
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from features.aggregate_features import process_answer
+from features.aggregate_features import process_question
+from features.nli_scoring import DEFAULT_BATCH_SIZE, configure_nli_cache
+from data_pipeline.stages import DEFAULT_NLI_CACHE, iter_questions, process_questions_parallel
+from data_pipeline.writers import CheckpointedJsonlWriter, ParquetRowWriter
 
 os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
 
@@ -52,59 +52,37 @@ os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
 
 #     return row
 
-def main(in_path, out_path, preview_n=None):
+def main(in_path, out_path, preview_n=None, nli_batch_size=DEFAULT_BATCH_SIZE, nli_cache_path=DEFAULT_NLI_CACHE, workers=1, resume=False,
+         output_format="jsonl"):
+    if output_format == "parquet" and resume:
+        raise ValueError("--resume is only supported for JSONL output")
+    nli_cache = configure_nli_cache(nli_cache_path)
+
     df = pd.read_csv(in_path)
     if preview_n:
         df = df.head(preview_n)
 
-    out_rows: List[dict] = []
-    for idx, row in tqdm(df.iterrows(), total=df.shape[0], desc="Questions"):
-        qid = row.get("Question ID", row.get("qid", idx))
-        q = row.get("Question", "")
-        true_list = list(ast.literal_eval(row.get("Correct Answers", "[]").strip() or "[]"))
-        false_list = list(ast.literal_eval(row.get("Incorrect Answers", "[]").strip() or "[]"))
-        raw_best_true = str(row.get("Best Answer", "") or "")
-        raw_best_false = str(row.get("Best Incorrect Answer", "") or "")
-        
-        # Normalize for membership checks
-        true_lower = {t.strip().lower() for t in true_list}
-        false_lower = {f.strip().lower() for f in false_list}
-        
-        best_true_text = None
-        if raw_best_true.strip() and raw_best_true.strip().lower() in true_lower:
-            best_true_text = raw_best_true.strip()
-
-        best_false_text = None
-        if raw_best_false.strip() and raw_best_false.strip().lower() in false_lower:
-            best_false_text = raw_best_false.strip()
-        
-        all_answers = true_list + false_list
-        if not all_answers:
-            print(f"Skipping empty question {qid}: {q}")
-            continue
-        
-        for ans in tqdm(all_answers, desc=f"Answers for Q{qid}", leave=False):
-            is_true = ans in true_list
-            is_best = (ans == best_true_text) if is_true else (ans == best_false_text)
-
-            out_rows.append(
-                process_answer(
-                    qid=qid,
-                    question=q,
-                    answer=ans,
-                    all_answers=all_answers,
-                    is_true=is_true,
-                    is_best=is_best,
-                    bta_text=best_true_text
-                )
-            )
-
-
-    with open(out_path, "w", encoding="utf-8") as f:
-        for r in out_rows:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
-
-    print(f"Wrote {len(out_rows)} rows to {out_path}")
+    if output_format == "parquet":
+        writer = ParquetRowWriter(out_path)
+        completed: set = set()
+    else:
+        writer = CheckpointedJsonlWriter(out_path, resume=resume)
+        completed = writer.completed
+    questions = (q for q in iter_questions(df) if str(q["qid"]) not in completed)
+    if workers > 1:
+        results = process_questions_parallel(questions, workers, nli_batch_size)
+    else:
+        results = (process_question(**q, batch_size=nli_batch_size) for q in questions)
+
+    try:
+        for rows in tqdm(results, total=df.shape[0] - len(completed), desc="Questions"):
+            writer.write_rows(rows)
+    finally:
+        writer.close()
+
+    print(f"Wrote {writer.rows_written} rows to {out_path}")
+    print(nli_cache.report())
+    nli_cache.close()
 
 
 if __name__ == "__main__":
@@ -112,12 +90,41 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("input", type=str, help="Input CSV file")
-    parser.add_argument("output", type=str, help="Output JSONL file")
+    parser.add_argument("output", type=str, help="Output JSONL (or Parquet with --format parquet) file")
     parser.add_argument(
         "--preview", type=int, default=None, help="Only process the first N rows"
     )
+    parser.add_argument(
+        "--nli-batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+        help="Number of (premise, hypothesis) pairs per NLI forward pass"
+    )
+    parser.add_argument(
+        "--nli-cache", type=str, default=DEFAULT_NLI_CACHE,
+        help="SQLite file used to persist NLI scores across runs"
+    )
+    parser.add_argument(
+        "--no-nli-cache", action="store_true", help="Keep NLI scores in memory only"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Processes for text feature extraction (NLI stays in the main process)"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Skip questions recorded in the output's .ckpt sidecar and append the rest"
+    )
+    parser.add_argument(
+        "--format", choices=["jsonl", "parquet"], default="jsonl",
+        help="parquet = typed columns in row groups, question/answer dictionary-encoded (no --resume)"
+    )
     args = parser.parse_args()
 
     # call main with args
-    main(args.input, args.output, args.preview)
+    main(
+        args.input, args.output, args.preview, args.nli_batch_size,
+        nli_cache_path=None if args.no_nli_cache else args.nli_cache,
+        workers=args.workers,
+        resume=args.resume,
+        output_format=args.format
+    )
 
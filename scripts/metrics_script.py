@@ -1,152 +1,151 @@
 # scripts/metrics_script.py
 import os, sys, json, argparse
-from pathlib import Path
-from typing import Optional, Dict, List
-import pandas as pd
+from typing import Optional, Dict, Iterable, Iterator, List, Tuple
 from tqdm import tqdm
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from evaluation.metric_calculation import compute_ra, compute_cc, compute_lhc, compute_ghi, compute_tuned_ghi
-from evaluation.bleu import compute_bleu_contrastive, compute_bleu_anchor
-from evaluation.rouge import compute_rouge_contrastive, compute_rouge_anchor
-
-def _load_rows(in_path: str, preview_n: Optional[int] = None) -> List[Dict]:
-    rows: List[Dict] = []
+from evaluation.metric_calculation import METRIC_INPUTS
+from evaluation.sweep import sweep_ghi_weights, reference_auroc
+from data_pipeline.stages import score_question, score_questions_parallel
+from data_pipeline.writers import IncrementalCsvWriter, ParquetRowWriter, is_parquet, iter_parquet_rows
+
+# Columns scoring reads; with --slim (or --sweep) only these are loaded and written
+ID_COLUMNS = ["qid", "question", "answer", "true_answer", "false_answer", "best_true_answer", "best_false_answer"]
+SCORING_COLUMNS = ID_COLUMNS + METRIC_INPUTS
+
+def _iter_rows(in_path: str, preview_n: Optional[int] = None, columns: Optional[List[str]] = None) -> Iterator[Dict]:
+    """Rows of a features JSONL or Parquet file, optionally restricted to `columns`."""
+    if is_parquet(in_path):
+        yield from iter_parquet_rows(in_path, columns=columns, limit=preview_n)
+        return
+
+    wanted = set(columns) if columns is not None else None
     with open(in_path, "r", encoding="utf-8") as f:
         for i, line in enumerate(f):
             if preview_n is not None and i >= preview_n:
                 break
             if not line.strip():
                 continue
-            rows.append(json.loads(line))
-    return rows
+            row = json.loads(line)
+            yield row if wanted is None else {k: v for k, v in row.items() if k in wanted}
 
-def _build_refs_by_qid(rows: List[Dict]) -> Dict[str, Dict[str, List[str]]]:
-    refs: Dict[str, Dict[str, List[str]]] = {}
-    for r in rows:
-        qid = str(r.get("qid"))
-        ans = str(r.get("answer", "")).strip()
-        if not ans:
-            continue
-        is_true = bool(r.get("true_answer", False))
-        bucket = "pos" if is_true else "neg"
-        if qid not in refs:
-            refs[qid] = {"pos": [], "neg": []}
-        if ans not in refs[qid][bucket]:
-            refs[qid][bucket].append(ans)
-    return refs
-
-# Best anchors per qid (from row flags)
-def _build_best_anchors(rows: List[Dict]) -> Dict[str, Dict[str, Optional[str]]]:
+def _load_rows(in_path: str, preview_n: Optional[int] = None, columns: Optional[List[str]] = None) -> List[Dict]:
+    return list(_iter_rows(in_path, preview_n=preview_n, columns=columns))
+
+def _iter_question_groups(rows: Iterable[Dict]) -> Iterator[List[Dict]]:
     """
-    Returns anchors_by_qid[qid] = {"bta": <best true>, "bfa": <best false>} if present.
+    Group consecutive rows by qid (the --assume-grouped streaming path).
+    References and anchors are per qid, so a qid that reappears after its group
+    has ended would be scored against partial references; that is an error
+    rather than a silent difference.
     """
-    anchors: Dict[str, Dict[str, Optional[str]]] = {}
+    seen = set()
+    group: List[Dict] = []
+    current = None
     for r in rows:
         qid = str(r.get("qid"))
-        ans = str(r.get("answer", "")).strip()
-        if not ans:
-            continue
-        if qid not in anchors:
-            anchors[qid] = {"bta": None, "bfa": None}
-        if r.get("best_true_answer", False):
-            anchors[qid]["bta"] = ans
-        if r.get("best_false_answer", False):
-            anchors[qid]["bfa"] = ans
-    return anchors
-
-def main(in_path: str, out_path: str, preview_n: Optional[int] = None, bleu_mode: str = "anchor"):
-    rows = _load_rows(in_path, preview_n=preview_n)
-
-    refs_by_qid = _build_refs_by_qid(rows)
-    anchors_by_qid = _build_best_anchors(rows)  # for pairwise BLEU
-
-    out_rows = []
-    for r in tqdm(rows, desc="Scoring rows"):
+        if qid != current:
+            if group:
+                yield group
+            if qid in seen:
+                raise ValueError(f"qid {qid} appears in more than one block; "
+                                 "input is not grouped by qid, run without --assume-grouped")
+            seen.add(qid)
+            current, group = qid, []
+        group.append(r)
+    if group:
+        yield group
+
+def _group_by_qid(rows: List[Dict]) -> Tuple[List[List[Dict]], List[List[int]]]:
+    """All rows of each qid wherever they appear, plus their positions in `rows`."""
+    groups: Dict[str, List[Dict]] = {}
+    positions: Dict[str, List[int]] = {}
+    for i, r in enumerate(rows):
         qid = str(r.get("qid"))
-        candidate = str(r.get("answer", "")).strip()
-
-        # Core metrics (per-row)
-        r["RA"]  = compute_ra(r)
-        r["CC"]  = compute_cc(r)
-        r["LHC"] = compute_lhc(r)
-        r["GHI"] = compute_ghi(r)
-        r["alt_GHI"] = compute_tuned_ghi(r)
-
-        # BLEU: compute both corpus-level and anchor-level
-        pos_refs = refs_by_qid.get(qid, {}).get("pos", [])
-        neg_refs = refs_by_qid.get(qid, {}).get("neg", [])
-
-        # Corpus BLEU (contrastive)
-        bleu_corpus = compute_bleu_contrastive(
-            candidate=candidate,
-            refs_pos=pos_refs,
-            refs_neg=neg_refs,
-            leave_one_out=True
-        )
-
-        # Anchor BLEU (local BTA/BFA comparison)
-        bta = anchors_by_qid.get(qid, {}).get("bta")  # may be None
-        bfa = anchors_by_qid.get(qid, {}).get("bfa")  # may be None
-        bleu_anchor = compute_bleu_anchor(
-            candidate=candidate,
-            bta_text=bta,
-            bfa_text=bfa
-        )
-
-        # Add all 6 metrics to the row
-        r.update({
-            # anchors
-            "bta": bta if bta else "",
-            "bfa": bfa if bfa else "",
-            # corpus-level
-            "bleu_pos": bleu_corpus["bleu_pos"],
-            "bleu_neg_max": bleu_corpus["bleu_neg_max"],
-            "bleu_contrast": bleu_corpus["bleu_contrast"],
-            # anchor-level
-            "bleu_bta": bleu_anchor["bleu_bta"],
-            "bleu_bfa": bleu_anchor["bleu_bfa"],
-            "bleu_bta_minus_bfa": bleu_anchor["bleu_bta_minus_bfa"],
-        })
-        
-        # ROUGE: corpus-level (contrastive)
-        rouge_corpus = compute_rouge_contrastive(
-            candidate=candidate,
-            refs_pos=pos_refs,
-            refs_neg=neg_refs,
-            leave_one_out=True
-        )
-
-        # ROUGE: anchor-level
-        rouge_anchor = compute_rouge_anchor(
-            candidate=candidate,
-            bta_text=bta,
-            bfa_text=bfa
-        )
-
-        r.update({
-            # corpus-level
-            "rouge_pos": rouge_corpus["rouge_pos"],
-            "rouge_neg_max": rouge_corpus["rouge_neg_max"],
-            "rouge_contrast": rouge_corpus["rouge_contrast"],
-            # anchor-level
-            "rouge_bta": rouge_anchor["rouge_bta"],
-            "rouge_bfa": rouge_anchor["rouge_bfa"],
-            "rouge_bta_minus_bfa": rouge_anchor["rouge_bta_minus_bfa"],
-        })
-
-        out_rows.append(r)
-
-    df = pd.DataFrame(out_rows)
-    df.to_csv(out_path, index=False)
-    print(f"Wrote {len(df)} rows with metrics (+BLEU:{bleu_mode}) to {out_path}")
+        groups.setdefault(qid, []).append(r)
+        positions.setdefault(qid, []).append(i)
+    return list(groups.values()), list(positions.values())
+
+def _score_in_input_order(rows: List[Dict], workers: int = 1, chunk_size: int = 1000) -> Iterator[List[Dict]]:
+    """
+    Score rows in any order: group them by qid in memory, score each group once,
+    and yield the scored rows back in input order (in chunks).
+    """
+    groups, positions = _group_by_qid(rows)
+    if workers > 1:
+        results = score_questions_parallel(iter(groups), workers)
+    else:
+        results = (score_question(g) for g in groups)
+
+    scored: List[Optional[Dict]] = [None] * len(rows)
+    for group_rows, group_positions in tqdm(zip(results, positions), total=len(groups), desc="Questions"):
+        for i, r in zip(group_positions, group_rows):
+            scored[i] = r
+    for start in range(0, len(scored), chunk_size):
+        yield scored[start:start + chunk_size]  # type: ignore[misc]
+
+def run_sweep(rows: List[Dict], out_path: str, step: float = 0.01, top_n: int = 10):
+    """
+    Grid-search GHI weights: AUROC of every (alpha, gamma, delta) on the simplex
+    for flagging hallucinated answers (true_answer == False). BLEU/ROUGE are skipped.
+    """
+    metric_columns = {k: [r.get(k) for r in rows] for k in METRIC_INPUTS}
+    hallucinated = [not bool(r.get("true_answer", False)) for r in rows]
+
+    results = sweep_ghi_weights(metric_columns, hallucinated, step=step)
+    results.to_csv(out_path, index=False)
+
+    print(f"Scored {len(results)} weight combinations over {len(rows)} rows; wrote {out_path}")
+    for name, auroc in reference_auroc(metric_columns, hallucinated).items():
+        print(f"  {name} (default weights): AUROC={auroc:.4f}")
+    print(results.head(top_n).to_string(index=False))
+
+def main(in_path: str, out_path: str, preview_n: Optional[int] = None, bleu_mode: str = "anchor",
+         sweep: bool = False, sweep_step: float = 0.01, workers: int = 1,
+         output_format: str = "csv", slim: bool = False, assume_grouped: bool = False):
+    if sweep:
+        rows = _load_rows(in_path, preview_n=preview_n, columns=METRIC_INPUTS + ["true_answer"])
+        run_sweep(rows, out_path, step=sweep_step)
+        return
+
+    columns = SCORING_COLUMNS if slim else None
+    rows = _iter_rows(in_path, preview_n=preview_n, columns=columns)
+    if assume_grouped:
+        # Streaming: one question group in memory at a time
+        groups = _iter_question_groups(rows)
+        if workers > 1:
+            results = tqdm(score_questions_parallel(groups, workers), desc="Questions")
+        else:
+            results = tqdm((score_question(g) for g in groups), desc="Questions")
+    else:
+        results = _score_in_input_order(list(rows), workers)
+
+    writer = ParquetRowWriter(out_path) if output_format == "parquet" else IncrementalCsvWriter(out_path)
+    try:
+        for chunk in results:
+            writer.write_rows(chunk)
+    finally:
+        writer.close()
+    print(f"Wrote {writer.rows_written} rows with metrics (+BLEU:{bleu_mode}) to {out_path}")
 
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
-    p.add_argument("input", type=str, help="Input JSONL features file")
-    p.add_argument("output", type=str, help="Output CSV file with metrics")
+    p.add_argument("input", type=str, help="Input features file (JSONL, or Parquet if it ends in .parquet)")
+    p.add_argument("output", type=str, help="Output CSV/Parquet file with metrics (or sweep results CSV with --sweep)")
     p.add_argument("--preview", type=int, default=None, help="Only process first N rows")
     p.add_argument("--bleu-mode", choices=["anchor","corpus"], default="anchor",
                    help="anchor = candidate vs. BTA/BFA only; corpus = vs. all refs for the QID")
+    p.add_argument("--sweep", action="store_true",
+                   help="Grid-search GHI weights by AUROC instead of writing per-row metrics")
+    p.add_argument("--sweep-step", type=float, default=0.01, help="Weight grid spacing for --sweep")
+    p.add_argument("--workers", type=int, default=1, help="Processes scoring question groups")
+    p.add_argument("--assume-grouped", action="store_true",
+                   help="Input rows of each qid are contiguous: stream one question at a time instead of loading all rows")
+    p.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                   help="Output format for per-row metrics")
+    p.add_argument("--slim", action="store_true",
+                   help="Read and write only id/label columns and metric inputs, not every feature")
     args = p.parse_args()
-    main(args.input, args.output, args.preview, args.bleu_mode)
+    main(args.input, args.output, args.preview, args.bleu_mode,
+         sweep=args.sweep, sweep_step=args.sweep_step, workers=args.workers,
+         output_format=args.format, slim=args.slim, assume_grouped=args.assume_grouped)
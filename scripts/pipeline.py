@@ -0,0 +1,98 @@
+# scripts/pipeline.py
+"""
+Features and metrics in one process.
+
+Each question's feature rows go straight from process_question to
+score_question and are dropped once written, so there is no JSONL round trip
+between features_script.py and metrics_script.py. The feature rows can still
+be kept with --features-out.
+"""
+import os
+import sys
+import argparse
+from typing import Optional
+import pandas as pd
+from tqdm import tqdm
+
+# add project root to sys.path so imports work
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from features.aggregate_features import process_question
+from features.nli_scoring import DEFAULT_BATCH_SIZE, configure_nli_cache
+from data_pipeline.stages import DEFAULT_NLI_CACHE, iter_questions, process_questions_parallel, score_question
+from data_pipeline.writers import CheckpointedJsonlWriter, IncrementalCsvWriter, ParquetRowWriter, is_parquet
+
+
+def _open_features_writer(features_path: Optional[str]):
+    if features_path is None:
+        return None
+    if is_parquet(features_path):
+        return ParquetRowWriter(features_path)
+    return CheckpointedJsonlWriter(features_path)
+
+
+def main(in_path, out_path, preview_n=None, nli_batch_size=DEFAULT_BATCH_SIZE, nli_cache_path=DEFAULT_NLI_CACHE,
+         workers=1, features_path=None, output_format="csv"):
+    nli_cache = configure_nli_cache(nli_cache_path)
+
+    df = pd.read_csv(in_path)
+    if preview_n:
+        df = df.head(preview_n)
+
+    questions = iter_questions(df)
+    if workers > 1:
+        features = process_questions_parallel(questions, workers, nli_batch_size)
+    else:
+        features = (process_question(**q, batch_size=nli_batch_size) for q in questions)
+
+    writer = ParquetRowWriter(out_path) if output_format == "parquet" else IncrementalCsvWriter(out_path)
+    features_writer = _open_features_writer(features_path)
+    try:
+        for rows in tqdm(features, total=df.shape[0], desc="Questions"):
+            if features_writer is not None:
+                # score_question adds metric columns in place; keep the feature rows as they were
+                features_writer.write_rows([dict(r) for r in rows])
+            writer.write_rows(score_question(rows))
+    finally:
+        writer.close()
+        if features_writer is not None:
+            features_writer.close()
+
+    print(f"Wrote {writer.rows_written} rows with features and metrics to {out_path}")
+    if features_path is not None:
+        print(f"Wrote feature rows to {features_path}")
+    print(nli_cache.report())
+    nli_cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute features and metrics for a TruthfulQA-style CSV in one pass")
+    parser.add_argument("input", type=str, help="Input CSV file")
+    parser.add_argument("output", type=str, help="Output CSV (or Parquet with --format parquet) with features and metrics")
+    parser.add_argument("--preview", type=int, default=None, help="Only process the first N rows")
+    parser.add_argument(
+        "--nli-batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+        help="Number of (premise, hypothesis) pairs per NLI forward pass"
+    )
+    parser.add_argument(
+        "--nli-cache", type=str, default=DEFAULT_NLI_CACHE,
+        help="SQLite file used to persist NLI scores across runs"
+    )
+    parser.add_argument("--no-nli-cache", action="store_true", help="Keep NLI scores in memory only")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Processes for text feature extraction (NLI and metrics stay in the main process)"
+    )
+    parser.add_argument(
+        "--features-out", type=str, default=None,
+        help="Also write the feature rows (JSONL, or Parquet if it ends in .parquet), as features_script.py would"
+    )
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Output format")
+    args = parser.parse_args()
+
+    main(
+        args.input, args.output, args.preview, args.nli_batch_size,
+        nli_cache_path=None if args.no_nli_cache else args.nli_cache,
+        workers=args.workers,
+        features_path=args.features_out,
+        output_format=args.format,
+    )